@@ -2,42 +2,38 @@
 GTFS Interpolator
 Calculates train position between stations based on GTFS-RT and static GTFS
 """
-from typing import Dict, Optional
+import time
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-import pytz
+from zoneinfo import ZoneInfo
+import numpy as np
 
+from interp_kernel import NUMBA_AVAILABLE, compute_positions, interp_trip
 
-JST = pytz.timezone('Asia/Tokyo')
+JST = ZoneInfo('Asia/Tokyo')
 
+# Per-trip stride for the batch segment key; larger than any GTFS time (24h+)
+SEG_KEY_SPAN = 1 << 20
 
-def time_to_seconds(time_str: str) -> Optional[int]:
-    """
-    Convert HH:MM:SS to seconds (supports 24+ hours)
-
-    Args:
-        time_str: Time string in HH:MM:SS format
+DAY_SEC = 86400
 
-    Returns:
-        Seconds since midnight, or None if invalid
-    """
-    if not time_str or time_str.strip() == '':
-        return None
 
-    try:
-        parts = time_str.split(':')
-        if len(parts) != 3:
-            return None
-        h, m, s = map(int, parts)
-        return h * 3600 + m * 60 + s
-    except (ValueError, AttributeError):
-        return None
+# Cached service day as [start_epoch, end_epoch); JST has no DST so a day is 86400s
+_day_cache = [0, 0]
 
 
 def get_service_day_start_epoch() -> int:
     """Get service day start time as epoch seconds (JST midnight)"""
+    now_epoch = time.time()
+    if _day_cache[0] <= now_epoch < _day_cache[1]:
+        return _day_cache[0]
+
     now = datetime.now(JST)
     start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    return int(start_of_day.timestamp())
+    start_epoch = int(start_of_day.timestamp())
+    _day_cache[0] = start_epoch
+    _day_cache[1] = start_epoch + 86400
+    return start_epoch
 
 
 class GTFSInterpolator:
@@ -50,11 +46,55 @@ class GTFSInterpolator:
         Initialize interpolator
 
         Args:
-            gtfs_loader: GTFSLoader instance with stops and stop_times
+            gtfs_loader: GTFSLoader instance with packed stop and stop time arrays
         """
         self.gtfs = gtfs_loader
-        self.stops = gtfs_loader.stops
-        self.stop_times = gtfs_loader.stop_times
+        self.stop_ids = gtfs_loader.stop_ids
+        self.stop_lat = gtfs_loader.stop_lat
+        self.stop_lng = gtfs_loader.stop_lng
+
+        self._build_batch_index()
+
+        # Segment found on the last call per trip row (-1 if none), shared by the
+        # scalar and batch paths and reset at service day rollover
+        self._seg_hint = np.full(len(self._trip_start), -1, dtype=np.int64)
+        self._seg_hint_day = 0
+        self._warm_kernel()
+
+    def _warm_kernel(self):
+        """Compile the kernels up front (cached on disk after the first run)"""
+        times = np.zeros(2, dtype=np.int32)
+        stops = np.zeros(2, dtype=np.int32)
+        coords = np.zeros(1, dtype=np.float64)
+        interp_trip(times, times, times, stops, coords, coords, 0, 2, 0, -1)
+
+        if NUMBA_AVAILABLE and len(self._trip_start):
+            none = np.zeros(1, dtype=np.int64)
+            self._compute_positions(none, none.astype(np.bool_), none, self._seg_hint)
+
+    def _build_batch_index(self):
+        """Build the flat per-trip arrays used by calculate_positions_batch"""
+        trip_ids = list(self.gtfs.trip_offsets)
+        self._trip_row = {trip_id: row for row, trip_id in enumerate(trip_ids)}
+
+        offsets = np.array([self.gtfs.trip_offsets[t] for t in trip_ids], dtype=np.int64).reshape(-1, 2)
+        self._trip_start = offsets[:, 0]
+        self._trip_end = offsets[:, 1]
+
+        # All stop patterns back to back, plus each trip's pattern offset
+        pattern_lens = np.array([len(p) for p in self.gtfs.pattern_stops], dtype=np.int64)
+        pattern_offsets = np.concatenate([[0], np.cumsum(pattern_lens)[:-1]]).astype(np.int64)
+        self._pattern_stop_idx = (
+            np.concatenate(self.gtfs.pattern_stops).astype(np.int64)
+            if self.gtfs.pattern_stops else np.empty(0, dtype=np.int64)
+        )
+        trip_pattern = np.array([self.gtfs.trip_pattern[t] for t in trip_ids], dtype=np.int64)
+        self._trip_pattern_start = pattern_offsets[trip_pattern]
+
+        # Segment end key made globally sorted by offsetting each trip by its row.
+        # Trips are packed in row order, so one searchsorted covers every trip
+        event_row = np.repeat(np.arange(len(trip_ids), dtype=np.int64), self._trip_end - self._trip_start)
+        self._seg_key = event_row * SEG_KEY_SPAN + self.gtfs.seg_end_sec.astype(np.int64)
 
     def calculate_position(
         self,
@@ -82,118 +122,278 @@ class GTFSInterpolator:
             - interpolated: Whether position was interpolated (vs. fallback)
         """
 
-        # Get stop_times for this trip
-        stop_times_list = self.stop_times.get(trip_id)
-        if not stop_times_list or len(stop_times_list) < 2:
+        # Get this trip's slice of the packed stop_times arrays and its stop pattern
+        offsets = self.gtfs.trip_offsets.get(trip_id)
+        if offsets is None:
             return None
 
-        # Convert timestamp to seconds since midnight (service day time)
-        current_time_sec = timestamp % 86400
+        start, end = offsets
+        if end - start < 2:
+            return None
 
         # Get service day start (for epoch conversion)
         service_start = get_service_day_start_epoch()
+        seg_hint = self._seg_hints(service_start)
+        row = self._trip_row[trip_id]
+
+        # Convert timestamp to seconds since JST midnight of its own day. A trip
+        # timed past 24:00 that is still running belongs to the previous day
+        current_time_sec = (timestamp - service_start) % DAY_SEC
+        service_start = timestamp - current_time_sec
+        if current_time_sec + DAY_SEC <= self.gtfs.seg_end_sec[end - 1]:
+            service_start -= DAY_SEC
+            current_time_sec += DAY_SEC
+
+        (from_idx, to_idx, dep_time, arr_time, progress, interpolated,
+         lat, lng, seg_idx) = interp_trip(
+            self.gtfs.seg_end_sec, self.gtfs.dep_sec, self.gtfs.arr_sec,
+            self.gtfs.pattern_stops[self.gtfs.trip_pattern[trip_id]],
+            self.stop_lat, self.stop_lng, start, end, current_time_sec,
+            int(seg_hint[row])
+        )
+        seg_hint[row] = seg_idx
+        if from_idx < 0:
+            return None
 
-        # Find current segment
-        # Iterate through consecutive stops to find where the train is
-        for i in range(len(stop_times_list) - 1):
-            from_st = stop_times_list[i]
-            to_st = stop_times_list[i + 1]
-
-            # Get departure time (fallback to arrival_time if empty)
-            dep_time = time_to_seconds(from_st["departure_time"])
-            if dep_time is None:
-                dep_time = time_to_seconds(from_st["arrival_time"])
-            if dep_time is None:
-                continue  # Skip this segment if no valid time
-
-            # Get arrival time (fallback to departure_time if empty)
-            arr_time = time_to_seconds(to_st["arrival_time"])
-            if arr_time is None:
-                arr_time = time_to_seconds(to_st["departure_time"])
-            if arr_time is None:
-                continue  # Skip this segment if no valid time
-
-            # Check if current time falls within this segment
-            if dep_time <= current_time_sec <= arr_time:
-                from_stop_id = from_st["stop_id"]
-                to_stop_id = to_st["stop_id"]
-
-                # Get station coordinates
-                from_pos = self.stops.get(from_stop_id)
-                to_pos = self.stops.get(to_stop_id)
-
-                if not from_pos or not to_pos:
-                    continue
-
-                # Calculate progress
-                duration = arr_time - dep_time
-                if duration <= 0:
-                    progress = 0.0
-                else:
-                    progress = (current_time_sec - dep_time) / duration
-                    progress = max(0.0, min(1.0, progress))
-
-                # Linear interpolation
-                lat = from_pos["lat"] + (to_pos["lat"] - from_pos["lat"]) * progress
-                lng = from_pos["lng"] + (to_pos["lng"] - from_pos["lng"]) * progress
-
-                # Convert segment times to epoch
-                seg_dep_epoch = service_start + dep_time
-                seg_arr_epoch = service_start + arr_time
-
-                return {
-                    "lat": lat,
-                    "lng": lng,
-                    "progress": progress,
-                    "from_stop_id": from_stop_id,
-                    "to_stop_id": to_stop_id,
-                    "seg_dep_epoch": seg_dep_epoch,
-                    "seg_arr_epoch": seg_arr_epoch,
-                    "current_time_sec": current_time_sec,
-                    "interpolated": True
-                }
-
-        # No matching segment found -> fallback to first/last stop
-        # This can happen if the train is before first departure or after last arrival
-
-        first_stop_id = stop_times_list[0]["stop_id"]
-        last_stop_id = stop_times_list[-1]["stop_id"]
-
-        first_dep = time_to_seconds(stop_times_list[0]["departure_time"]) or \
-                    time_to_seconds(stop_times_list[0]["arrival_time"]) or 0
-        last_arr = time_to_seconds(stop_times_list[-1]["arrival_time"]) or \
-                   time_to_seconds(stop_times_list[-1]["departure_time"]) or 86400
-
-        # Before first departure -> show at first stop
-        if first_dep is not None and current_time_sec < first_dep:
-            stop_pos = self.stops.get(first_stop_id)
-            if stop_pos:
-                return {
-                    "lat": stop_pos["lat"],
-                    "lng": stop_pos["lng"],
-                    "progress": 0.0,
-                    "from_stop_id": first_stop_id,
-                    "to_stop_id": None,
-                    "seg_dep_epoch": service_start + first_dep,
-                    "seg_arr_epoch": service_start + first_dep,
-                    "current_time_sec": current_time_sec,
-                    "interpolated": False
-                }
-
-        # After last arrival -> show at last stop
-        if last_arr is not None and current_time_sec > last_arr:
-            stop_pos = self.stops.get(last_stop_id)
-            if stop_pos:
-                return {
-                    "lat": stop_pos["lat"],
-                    "lng": stop_pos["lng"],
-                    "progress": 1.0,
-                    "from_stop_id": last_stop_id,
-                    "to_stop_id": None,
-                    "seg_dep_epoch": service_start + last_arr,
-                    "seg_arr_epoch": service_start + last_arr,
-                    "current_time_sec": current_time_sec,
-                    "interpolated": False
-                }
-
-        return None
+        segment = (int(from_idx), int(to_idx), int(dep_time), int(arr_time),
+                   float(progress), bool(interpolated))
+        return self._build_position(
+            segment, float(lat), float(lng), service_start, current_time_sec
+        )
+
+    def calculate_positions_batch(
+        self,
+        trip_ids: List[str],
+        timestamps: List[int]
+    ) -> List[Optional[Dict]]:
+        """
+        Calculate positions for many vehicles at once
+
+        Segment search, progress and interpolation run in the parallel Numba
+        kernel (NumPy array operations without Numba); only the result dicts
+        are built in Python.
+
+        Args:
+            trip_ids: GTFS trip_ids (one per vehicle)
+            timestamps: Unix timestamps from GTFS-RT (one per vehicle)
+
+        Returns:
+            List aligned with trip_ids, holding the same dicts as
+            calculate_position (or None where no position could be determined)
+        """
+        results: List[Optional[Dict]] = [None] * len(trip_ids)
+        if not trip_ids:
+            return results
+
+        columns = self.calculate_positions_columns(trip_ids, timestamps)
+        slots = columns["slot"]
+
+        # Unbox each column once with tolist() rather than per-element scalars
+        rows = zip(
+            slots.tolist(),
+            *[columns[name][slots].tolist() for name in (
+                "from_idx", "to_idx", "dep_time", "arr_time", "progress",
+                "interpolated", "lat", "lng", "service_start", "current_time_sec"
+            )]
+        )
+        for slot, *segment, slot_lat, slot_lng, slot_start, slot_current in rows:
+            results[slot] = self._build_position(
+                tuple(segment), slot_lat, slot_lng, slot_start, slot_current
+            )
+
+        return results
+
+    def calculate_positions_columns(
+        self,
+        trip_ids: List[str],
+        timestamps: List[int]
+    ) -> Dict[str, np.ndarray]:
+        """
+        Calculate positions for many vehicles as column arrays (no per-vehicle objects)
+
+        Args:
+            trip_ids: GTFS trip_ids (one per vehicle)
+            timestamps: Unix timestamps from GTFS-RT (one per vehicle)
+
+        Returns:
+            Dict of arrays aligned with trip_ids:
+            - slot: Indices of the vehicles that could be positioned
+            - from_idx, to_idx: Stop indices into stop_ids (to_idx -1 when held at a stop)
+            - dep_time, arr_time: Segment times in seconds since service day start
+            - seg_dep_epoch, seg_arr_epoch: Segment departure/arrival epoch times
+            - progress, interpolated, lat, lng
+            - service_start, current_time_sec: Service day of each vehicle
+        """
+        # Trip rows (-1 for unknown trips)
+        rows = np.array([self._trip_row.get(trip_id, -1) for trip_id in trip_ids], dtype=np.int64)
+
+        known = rows >= 0
+
+        # Service day time per vehicle, moving trips still running past 24:00
+        # onto the previous service day (same rule as calculate_position)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        current = (timestamps - get_service_day_start_epoch()) % DAY_SEC
+        service_start = timestamps - current
+
+        # No known trip (also the case when the loader has no stop_times at all):
+        # skip the per-trip lookups, which would index empty arrays
+        if not known.any():
+            return self._unpositioned_columns(service_start, current)
+
+        rows = np.where(known, rows, 0)
+        start = self._trip_start[rows]
+        end = self._trip_end[rows]
+        known &= (end - start) >= 2
+
+        prev_day = known & (current + DAY_SEC <= self.gtfs.seg_end_sec[end - 1])
+        service_start -= np.where(prev_day, DAY_SEC, 0)
+        current += np.where(prev_day, DAY_SEC, 0)
+
+        if NUMBA_AVAILABLE:
+            columns = self._compute_positions(
+                rows, known, current, self._seg_hints(get_service_day_start_epoch())
+            )
+        else:
+            # One global searchsorted; per-trip hints don't apply here
+            columns = self._positions_numpy(rows, known, current)
+        from_idx, to_idx, dep_time, arr_time, progress, interpolated, lat, lng = columns
+
+        return {
+            "slot": np.flatnonzero(from_idx >= 0),
+            "from_idx": from_idx,
+            "to_idx": to_idx,
+            "dep_time": dep_time,
+            "arr_time": arr_time,
+            "seg_dep_epoch": service_start + dep_time,
+            "seg_arr_epoch": service_start + arr_time,
+            "progress": progress,
+            "interpolated": interpolated,
+            "lat": lat,
+            "lng": lng,
+            "service_start": service_start,
+            "current_time_sec": current,
+        }
+
+    def _unpositioned_columns(self, service_start: np.ndarray, current: np.ndarray) -> Dict[str, np.ndarray]:
+        """Columns for vehicles none of which could be positioned (empty slot, NaN coordinates)"""
+        n = len(current)
+        no_stop = np.full(n, -1, dtype=np.int64)
+        no_time = np.zeros(n, dtype=np.int64)
+        nan = np.full(n, np.nan)
+
+        return {
+            "slot": np.empty(0, dtype=np.int64),
+            "from_idx": no_stop,
+            "to_idx": no_stop.copy(),
+            "dep_time": no_time,
+            "arr_time": no_time.copy(),
+            "seg_dep_epoch": service_start.copy(),
+            "seg_arr_epoch": service_start.copy(),
+            "progress": nan,
+            "interpolated": np.zeros(n, dtype=np.bool_),
+            "lat": nan.copy(),
+            "lng": nan.copy(),
+            "service_start": service_start,
+            "current_time_sec": current,
+        }
+
+    def _seg_hints(self, service_start: int) -> np.ndarray:
+        """Per-trip segment hints, cleared when the service day changes"""
+        if service_start != self._seg_hint_day:
+            self._seg_hint.fill(-1)
+            self._seg_hint_day = service_start
+        return self._seg_hint
+
+    def _compute_positions(
+        self,
+        rows: np.ndarray,
+        known: np.ndarray,
+        current: np.ndarray,
+        seg_hint: np.ndarray
+    ) -> Tuple:
+        """Position every vehicle with the parallel Numba kernel (updates seg_hint in place)"""
+        return compute_positions(
+            self.gtfs.seg_end_sec, self.gtfs.dep_sec, self.gtfs.arr_sec,
+            self._pattern_stop_idx, self._trip_start, self._trip_end,
+            self._trip_pattern_start, self.stop_lat, self.stop_lng,
+            rows, known, current, seg_hint
+        )
+
+    def _positions_numpy(self, rows: np.ndarray, known: np.ndarray, current: np.ndarray) -> Tuple:
+        """Same result as _compute_positions using NumPy array operations (no Numba)"""
+        start = self._trip_start[rows]
+        end = self._trip_end[rows]
+        pattern_start = self._trip_pattern_start[rows]
+
+        # Find current segment for every vehicle with one searchsorted on the
+        # trip-ranked key (same result as the per-trip binary search)
+        i = np.searchsorted(self._seg_key, rows * SEG_KEY_SPAN + current, side='left')
+        in_trip = known & (i < end - 1)
+        i = np.where(in_trip, i, start)
+
+        dep_time = self.gtfs.dep_sec[i].astype(np.int64)
+        arr_time = self.gtfs.arr_sec[i + 1].astype(np.int64)
+        from_idx = self._pattern_stop_idx[pattern_start + (i - start)]
+        to_idx = self._pattern_stop_idx[pattern_start + (i - start) + 1]
+
+        # Check if current time falls within the segment (both ends timed)
+        interpolated = (in_trip & (dep_time >= 0) & (arr_time >= 0)
+                        & (from_idx >= 0) & (to_idx >= 0)
+                        & (dep_time <= current) & (current <= arr_time))
+
+        # Calculate progress
+        duration = arr_time - dep_time
+        progress = np.where(duration > 0, (current - dep_time) / np.maximum(duration, 1), 0.0)
+        progress = np.clip(progress, 0.0, 1.0)
+
+        # No matching segment -> fallback to first/last stop
+        first_dep = self.gtfs.dep_sec[start].astype(np.int64)
+        first_dep = np.where(first_dep > 0, first_dep, 0)
+        last_arr = self.gtfs.arr_sec[end - 1].astype(np.int64)
+        last_arr = np.where(last_arr > 0, last_arr, 86400)
+        first_stop = self._pattern_stop_idx[pattern_start]
+        last_stop = self._pattern_stop_idx[pattern_start + (end - start) - 1]
+
+        before = known & ~interpolated & (current < first_dep) & (first_stop >= 0)
+        after = known & ~interpolated & ~before & (current > last_arr) & (last_stop >= 0)
+
+        from_idx = np.select([before, after], [first_stop, last_stop], from_idx)
+        to_idx = np.where(interpolated, to_idx, -1)
+        dep_time = np.select([before, after], [first_dep, last_arr], dep_time)
+        arr_time = np.select([before, after], [first_dep, last_arr], arr_time)
+        progress = np.select([before, after], [0.0, 1.0], progress)
+
+        # Linear interpolation (held trains stay on their from-stop)
+        positioned = interpolated | before | after
+        from_idx = np.where(positioned, from_idx, 0)
+        lat_from = self.stop_lat[from_idx]
+        lng_from = self.stop_lng[from_idx]
+        to_or_from = np.where(to_idx >= 0, to_idx, from_idx)
+        lat = lat_from + (self.stop_lat[to_or_from] - lat_from) * progress
+        lng = lng_from + (self.stop_lng[to_or_from] - lng_from) * progress
+        from_idx = np.where(positioned, from_idx, -1)
+
+        return from_idx, to_idx, dep_time, arr_time, progress, interpolated, lat, lng
+
+    def _build_position(
+        self,
+        segment: Tuple,
+        lat: float,
+        lng: float,
+        service_start: int,
+        current_time_sec: int
+    ) -> Dict:
+        """Build the position dict returned by calculate_position"""
+        from_idx, to_idx, dep_time, arr_time, progress, interpolated = segment
+
+        return {
+            "lat": lat,
+            "lng": lng,
+            "progress": progress,
+            "from_stop_id": self.stop_ids[from_idx],
+            "to_stop_id": self.stop_ids[to_idx] if to_idx >= 0 else None,
+            "seg_dep_epoch": service_start + dep_time,
+            "seg_arr_epoch": service_start + arr_time,
+            "current_time_sec": current_time_sec,
+            "interpolated": interpolated
+        }
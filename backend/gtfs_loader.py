@@ -2,19 +2,61 @@
 GTFS Static Data Loader
 Loads stops, routes, trips, and stop_times from JSON files
 """
-import json
+import hashlib
 import os
+import pickle
 from pathlib import Path
-from typing import Dict, List
+from collections.abc import Mapping
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import ijson
+import numpy as np
+import orjson
+
+
+GTFS_JSON_FILES = ["stops.json", "routes.json", "trips.json", "stop_times.json"]
+CACHE_VERSION = 4  # Bump when the cached layout changes
+CACHE_ARRAYS = ["stop_lat", "stop_lng", "dep_sec", "arr_sec", "stop_sequence", "seg_end_sec"]
+
+# Sort key for (stop_sequence, stop_id, dep_sec, arr_sec, raw_times) stop event rows,
+# where raw_times is the original (arrival, departure) strings or None
+_by_sequence = itemgetter(0)
 
 
 class GTFSLoader:
     def __init__(self, data_path: str):
         self.data_path = Path(data_path)
         self.stops: Dict[str, dict] = {}
+        self.stop_id_to_idx: Dict[str, int] = {}  # stop_id -> index into stop arrays
+        self.stop_ids: List[str] = []  # index -> stop_id
+        self.stop_lat = np.empty(0, dtype=np.float64)
+        self.stop_lng = np.empty(0, dtype=np.float64)
         self.routes: Dict[str, dict] = {}
         self.trips: Dict[str, dict] = {}
-        self.stop_times: Dict[str, List[dict]] = {}  # trip_id -> list of stop_times
+        self.stop_times = StopTimesView(self)  # trip_id -> list of stop_times (compatibility view)
+
+        # Packed stop_times ("forward star"): one entry per stop event, trips stored
+        # contiguously in stop_sequence order; trip_offsets maps trip_id -> (start, end)
+        self.trip_offsets: Dict[str, Tuple[int, int]] = {}
+        self.dep_sec = np.empty(0, dtype=np.int32)  # departure seconds per event (-1 if untimed)
+        self.arr_sec = np.empty(0, dtype=np.int32)  # arrival seconds per event (-1 if untimed)
+        self.stop_sequence = np.empty(0, dtype=np.int32)
+        self.seg_end_sec = np.empty(0, dtype=np.int32)  # per-trip sorted segment end times for binary search
+
+        # event index -> (arrival_time, departure_time) as given in stop_times.json, kept
+        # only where rendering dep_sec/arr_sec would not reproduce it (missing, one-sided
+        # or non-canonical times); sparse, empty for clean feeds
+        self.raw_times: Dict[int, Tuple[object, object]] = {}
+
+        # Stop patterns: trips with the same stop sequence share one stop index array
+        self.patterns: Dict[Tuple[str, ...], int] = {}  # stop_id sequence -> pattern index
+        self.pattern_stops: List[np.ndarray] = []  # pattern index -> stop index per stop (-1 if unknown)
+        self.trip_pattern: Dict[str, int] = {}  # trip_id -> pattern index
+        self.pattern_stop_ids: List[Tuple[str, ...]] = []  # pattern index -> stop_ids as in stop_times.json
+
+        # trip_id -> {stop_id: position in the trip}, one dict shared per pattern
+        self.stop_index: Dict[str, Dict[str, int]] = {}
 
         self.load_all()
 
@@ -22,14 +64,93 @@ class GTFSLoader:
         """Load all GTFS data"""
         print(f"[GTFSLoader] Loading data from {self.data_path}")
 
-        self._load_stops()
-        self._load_routes()
-        self._load_trips()
-        self._load_stop_times()
+        cache_base = self._cache_base()
+        if cache_base and self._load_cache(cache_base):
+            print(f"[GTFSLoader] Loaded from cache {cache_base.name}")
+        else:
+            self._load_stops()
+            self._load_routes()
+            self._load_trips()
+            self._load_stop_times()
+
+            if cache_base:
+                self._save_cache(cache_base)
+
+        self._build_pattern_stop_ids()
+        self._build_stop_index()
 
         print(f"[GTFSLoader] Loaded: {len(self.stops)} stops, "
               f"{len(self.routes)} routes, {len(self.trips)} trips, "
-              f"{len(self.stop_times)} trip stop_times")
+              f"{len(self.trip_offsets)} trip stop_times")
+
+    def _cache_base(self) -> Path | None:
+        """Cache file stem keyed on data path and the newest JSON mtime"""
+        mtimes = [
+            (self.data_path / name).stat().st_mtime_ns
+            for name in GTFS_JSON_FILES
+            if (self.data_path / name).exists()
+        ]
+        if not mtimes:
+            return None
+
+        key_src = f"{CACHE_VERSION}:{self.data_path.resolve()}:{max(mtimes)}"
+        key = hashlib.sha1(key_src.encode()).hexdigest()[:12]
+        return self.data_path / f".cache-{key}"
+
+    def _load_cache(self, cache_base: Path) -> bool:
+        """Restore parsed data from cache; returns False on miss"""
+        pkl_file = cache_base.with_suffix(".pkl")
+        npz_file = cache_base.with_suffix(".npz")
+        if not pkl_file.exists() or not npz_file.exists():
+            return False
+
+        try:
+            with open(pkl_file, 'rb') as f:
+                state = pickle.load(f)
+            with np.load(npz_file) as arrays:
+                for name in CACHE_ARRAYS:
+                    setattr(self, name, arrays[name])
+        except Exception as e:
+            print(f"[GTFSLoader] Warning: ignoring unreadable cache: {e}")
+            return False
+
+        self.stops = state["stops"]
+        self.routes = state["routes"]
+        self.trips = state["trips"]
+        self.stop_ids = state["stop_ids"]
+        self.stop_id_to_idx = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        self.trip_offsets = state["trip_offsets"]
+        self.patterns = state["patterns"]
+        self.pattern_stops = state["pattern_stops"]
+        self.trip_pattern = state["trip_pattern"]
+        self.raw_times = state["raw_times"]
+        return True
+
+    def _save_cache(self, cache_base: Path):
+        """Write parsed data next to the JSON files, replacing older caches"""
+        state = {
+            "stops": self.stops,
+            "routes": self.routes,
+            "trips": self.trips,
+            "stop_ids": self.stop_ids,
+            "trip_offsets": self.trip_offsets,
+            "patterns": self.patterns,
+            "pattern_stops": self.pattern_stops,
+            "trip_pattern": self.trip_pattern,
+            "raw_times": self.raw_times,
+        }
+        arrays = {name: getattr(self, name) for name in CACHE_ARRAYS}
+
+        try:
+            for old_file in self.data_path.glob(".cache-*"):
+                old_file.unlink()
+
+            with open(cache_base.with_suffix(".npz"), 'wb') as f:
+                np.savez(f, **arrays)
+            with open(cache_base.with_suffix(".pkl"), 'wb') as f:
+                pickle.dump(state, f, protocol=5)
+        except OSError as e:
+            print(f"[GTFSLoader] Warning: could not write cache: {e}")
 
     def _load_stops(self):
         """Load stops.json"""
@@ -38,8 +159,8 @@ class GTFSLoader:
             print(f"[GTFSLoader] Warning: {stops_file} not found")
             return
 
-        with open(stops_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(stops_file, 'rb') as f:
+            data = orjson.loads(f.read())
 
         for stop in data:
             stop_id = stop.get("stop_id")
@@ -51,6 +172,16 @@ class GTFSLoader:
                     "lng": float(stop.get("stop_lon", 0))
                 }
 
+        # Struct-of-arrays copy of the coordinates for index-based interpolation
+        n = len(self.stops)
+        self.stop_ids = list(self.stops)
+        self.stop_id_to_idx = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        self.stop_lat = np.empty(n, dtype=np.float64)
+        self.stop_lng = np.empty(n, dtype=np.float64)
+        for i, stop in enumerate(self.stops.values()):
+            self.stop_lat[i] = stop["lat"]
+            self.stop_lng[i] = stop["lng"]
+
         print(f"[GTFSLoader] Loaded {len(self.stops)} stops")
 
     def _load_routes(self):
@@ -60,8 +191,8 @@ class GTFSLoader:
             print(f"[GTFSLoader] Warning: {routes_file} not found")
             return
 
-        with open(routes_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(routes_file, 'rb') as f:
+            data = orjson.loads(f.read())
 
         for route in data:
             route_id = route.get("route_id")
@@ -82,8 +213,8 @@ class GTFSLoader:
             print(f"[GTFSLoader] Warning: {trips_file} not found")
             return
 
-        with open(trips_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(trips_file, 'rb') as f:
+            data = orjson.loads(f.read())
 
         for trip in data:
             trip_id = trip.get("trip_id")
@@ -98,36 +229,115 @@ class GTFSLoader:
         print(f"[GTFSLoader] Loaded {len(self.trips)} trips")
 
     def _load_stop_times(self):
-        """Load stop_times.json and group by trip_id"""
+        """Stream stop_times.json, group by trip_id and pack into flat arrays"""
         stop_times_file = self.data_path / "stop_times.json"
         if not stop_times_file.exists():
             print(f"[GTFSLoader] Warning: {stop_times_file} not found")
             return
 
-        with open(stop_times_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # Stream records (only one parsed record is live at a time) and keep a
+        # compact (stop_sequence, stop_id, dep_sec, arr_sec, raw_times) row per stop event,
+        # raw_times being the original (arrival, departure) strings or None
+        rows_by_trip: Dict[str, List[tuple]] = {}
+        with open(stop_times_file, 'rb') as f:
+            for stop_time in ijson.items(f, 'item'):
+                trip_id = stop_time.get("trip_id")
+                if not trip_id:
+                    continue
 
-        # Group by trip_id
-        for stop_time in data:
-            trip_id = stop_time.get("trip_id")
-            if not trip_id:
-                continue
+                if trip_id not in rows_by_trip:
+                    rows_by_trip[trip_id] = []
 
-            if trip_id not in self.stop_times:
-                self.stop_times[trip_id] = []
+                # Departure falls back to arrival and vice versa, -1 if untimed
+                raw_dep = stop_time.get("departure_time", "00:00:00")
+                raw_arr = stop_time.get("arrival_time", "00:00:00")
+                dep = _parse_gtfs_time(raw_dep)
+                arr = _parse_gtfs_time(raw_arr)
+                if dep is None:
+                    dep = arr
+                if arr is None:
+                    arr = dep
+                dep = -1 if dep is None else dep
+                arr = -1 if arr is None else arr
 
-            self.stop_times[trip_id].append({
-                "stop_id": stop_time.get("stop_id", ""),
-                "arrival_time": stop_time.get("arrival_time", "00:00:00"),
-                "departure_time": stop_time.get("departure_time", "00:00:00"),
-                "stop_sequence": int(stop_time.get("stop_sequence", 0))
-            })
+                # Keep the original strings only where the arrays can't reproduce them
+                raw = None
+                if not (_renders_as(raw_dep, dep) and _renders_as(raw_arr, arr)):
+                    raw = (raw_arr, raw_dep)
+
+                rows_by_trip[trip_id].append((
+                    int(stop_time.get("stop_sequence", 0)),
+                    stop_time.get("stop_id", ""),
+                    dep,
+                    arr,
+                    raw
+                ))
+
+        # Preallocate the packed arrays
+        n_events = sum(len(rows) for rows in rows_by_trip.values())
+        self.dep_sec = np.empty(n_events, dtype=np.int32)
+        self.arr_sec = np.empty(n_events, dtype=np.int32)
+        self.stop_sequence = np.empty(n_events, dtype=np.int32)
+        self.seg_end_sec = np.empty(n_events, dtype=np.int32)
+
+        # Fill each trip's slice in stop_sequence order
+        start = 0
+        for trip_id, rows in rows_by_trip.items():
+            rows.sort(key=_by_sequence)
+
+            end = start + len(rows)
+            self._fill_trip(rows, start, end)
+            for k, row in enumerate(rows):
+                if row[4] is not None:
+                    self.raw_times[start + k] = row[4]
+            self.trip_offsets[trip_id] = (start, end)
+            self.trip_pattern[trip_id] = self._intern_pattern(rows)
+            start = end
+
+        print(f"[GTFSLoader] Loaded stop_times for {len(self.trip_offsets)} trips "
+              f"({len(self.pattern_stops)} stop patterns)")
+
+    def _intern_pattern(self, rows: List[tuple]) -> int:
+        """Return the pattern index for a trip's stop sequence, registering it if new"""
+        key = tuple(row[1] for row in rows)
+        pattern_idx = self.patterns.setdefault(key, len(self.patterns))
+        if pattern_idx == len(self.pattern_stops):
+            self.pattern_stops.append(
+                np.array([self.stop_id_to_idx.get(stop_id, -1) for stop_id in key], dtype=np.int32)
+            )
+        return pattern_idx
 
-        # Sort each trip's stop_times by stop_sequence
-        for trip_id in self.stop_times:
-            self.stop_times[trip_id].sort(key=lambda x: x["stop_sequence"])
+    def _build_pattern_stop_ids(self):
+        """Recover each pattern's original stop_id sequence (kept even for stops missing from stops.json)"""
+        self.pattern_stop_ids = [()] * len(self.patterns)
+        for key, pattern_idx in self.patterns.items():
+            self.pattern_stop_ids[pattern_idx] = key
 
-        print(f"[GTFSLoader] Loaded stop_times for {len(self.stop_times)} trips")
+    def _build_stop_index(self):
+        """Build trip_id -> stop_id -> position lookups (last visit wins, as a linear scan would)"""
+        pattern_index = [
+            {stop_id: pos for pos, stop_id in enumerate(key)}
+            for key in self.pattern_stop_ids
+        ]
+        self.stop_index = {trip_id: pattern_index[p] for trip_id, p in self.trip_pattern.items()}
+
+    def _fill_trip(self, rows: List[tuple], start: int, end: int):
+        """Write one trip's sorted stop events into the packed arrays"""
+        self.stop_sequence[start:end] = [row[0] for row in rows]
+        self.dep_sec[start:end] = [row[2] for row in rows]
+        self.arr_sec[start:end] = [row[3] for row in rows]
+
+        dep_sec = self.dep_sec[start:end]
+        arr_sec = self.arr_sec[start:end]
+
+        # Segment i ends at arrival of stop i+1. Segments touching an untimed stop
+        # repeat the previous end time so the key stays sorted and a left binary
+        # search always lands on the first timed segment not yet ended. The trip's last
+        # slot has no segment and just carries the final value.
+        seg_end = np.where((dep_sec[:-1] >= 0) & (arr_sec[1:] >= 0), arr_sec[1:], -1)
+        seg_end = np.maximum.accumulate(seg_end)
+        self.seg_end_sec[start:end - 1] = seg_end
+        self.seg_end_sec[end - 1] = seg_end[-1] if len(seg_end) else -1
 
     def get_stop(self, stop_id: str) -> dict | None:
         """Get stop by ID"""
@@ -140,3 +350,104 @@ class GTFSLoader:
     def get_stop_times_for_trip(self, trip_id: str) -> List[dict]:
         """Get stop_times for a trip"""
         return self.stop_times.get(trip_id, [])
+
+
+def time_to_seconds(time_str: str) -> Optional[int]:
+    """
+    Convert HH:MM:SS to seconds (supports 24+ hours)
+
+    Args:
+        time_str: Time string in HH:MM:SS format
+
+    Returns:
+        Seconds since midnight, or None if invalid
+    """
+    if not time_str or time_str.strip() == '':
+        return None
+
+    try:
+        parts = time_str.split(':')
+        if len(parts) != 3:
+            return None
+        h, m, s = map(int, parts)
+        return h * 3600 + m * 60 + s
+    except (ValueError, AttributeError):
+        return None
+
+
+# ord("0") weighted by the digit place values used in _parse_gtfs_time
+_TIME_DIGIT_OFFSET = 48 * (36000 + 3600 + 600 + 60 + 10 + 1)
+
+
+def _parse_gtfs_time(time_str: str) -> int | None:
+    """HH:MM:SS to seconds, with a fast path for the fixed-width zero-padded form"""
+    if not time_str:  # Missing, empty or JSON null
+        return None
+
+    # Every digit position checked (isascii rules out non-ASCII digits such as "²")
+    if (len(time_str) == 8 and time_str[2] == ':' and time_str[5] == ':' and time_str.isascii()
+            and time_str[:2].isdigit() and time_str[3:5].isdigit() and time_str[6:].isdigit()):
+        o = ord
+        return (o(time_str[0]) * 36000 + o(time_str[1]) * 3600 + o(time_str[3]) * 600
+                + o(time_str[4]) * 60 + o(time_str[6]) * 10 + o(time_str[7]) - _TIME_DIGIT_OFFSET)
+    return time_to_seconds(time_str)
+
+
+def _renders_as(time_str, seconds: int) -> bool:
+    """True if seconds_to_time(seconds) gives back time_str exactly"""
+    if seconds < 0:
+        return time_str == ""
+    return (isinstance(time_str, str) and len(time_str) == 8 and time_str.isascii()
+            and time_str[2] == ':' and time_str[5] == ':'
+            and time_str[:2].isdigit() and time_str[3:5].isdigit() and time_str[6:].isdigit()
+            and time_str[3] < '6' and time_str[6] < '6')
+
+
+def seconds_to_time(seconds: int) -> str:
+    """Convert seconds since midnight to HH:MM:SS ("" if untimed)"""
+    if seconds < 0:
+        return ""
+    h, rem = divmod(int(seconds), 3600)
+    m, s = divmod(rem, 60)
+    return f"{h:02d}:{m:02d}:{s:02d}"
+
+
+class StopTimesView(Mapping):
+    """
+    Read-only trip_id -> list of stop_time dicts, built on demand from the
+    loader's packed arrays. Kept for callers of the original dict layout; hot
+    paths should read trip_offsets and the arrays directly. Times are rendered
+    back to HH:MM:SS from the arrays; where that would differ from
+    stop_times.json (missing, one-sided or non-canonical times) the original
+    values are returned from raw_times, so every record round-trips exactly.
+    Note dep_sec/arr_sec themselves hold the fallback-applied seconds.
+    """
+
+    def __init__(self, loader: "GTFSLoader"):
+        self._loader = loader
+
+    def __getitem__(self, trip_id: str) -> List[dict]:
+        loader = self._loader
+        start, end = loader.trip_offsets[trip_id]
+        stop_ids = loader.pattern_stop_ids[loader.trip_pattern[trip_id]]
+        raw_times = loader.raw_times
+
+        stop_times = []
+        for k in range(start, end):
+            raw = raw_times.get(k)
+            stop_times.append({
+                "stop_id": stop_ids[k - start],
+                "arrival_time": raw[0] if raw else seconds_to_time(loader.arr_sec[k]),
+                "departure_time": raw[1] if raw else seconds_to_time(loader.dep_sec[k]),
+                "stop_sequence": int(loader.stop_sequence[k])
+            })
+        return stop_times
+
+    def __contains__(self, trip_id: object) -> bool:
+        return trip_id in self._loader.trip_offsets
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._loader.trip_offsets)
+
+    def __len__(self) -> int:
+        return len(self._loader.trip_offsets)
@@ -3,9 +3,14 @@ GTFS-RT Client
 Fetches real-time vehicle positions from GTFS-RT feed
 """
 import gzip
+import io
+import os
 import httpx
 from typing import List, Dict, Optional
 from pathlib import Path
+
+# Use the C (upb) protobuf runtime; must be set before protobuf is first imported
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "upb")
 import gtfs_realtime_pb2
 
 
@@ -23,6 +28,17 @@ class GTFSRTClient:
         self.consecutive_failures = 0
         self.backoff_sec = 3
 
+        # One keep-alive client for all polls (avoids a TCP/TLS handshake per poll)
+        self._client: Optional[httpx.AsyncClient] = None
+        if feed_url:
+            self._client = httpx.AsyncClient(timeout=10.0, http2=True)
+
+    async def aclose(self):
+        """Close the underlying HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     async def get_vehicles(self) -> List[Dict]:
         """
         Get vehicle positions from GTFS-RT feed
@@ -50,9 +66,10 @@ class GTFSRTClient:
             # Parse GTFS-RT protobuf
             feed = gtfs_realtime_pb2.FeedMessage()
 
-            # Handle gzip compression
-            if raw_data[:2] == b"\x1f\x8b":
-                raw_data = gzip.decompress(raw_data)
+            # Handle gzip compression (stream-decode without slicing the buffer)
+            if raw_data.startswith(b"\x1f\x8b"):
+                with gzip.GzipFile(fileobj=io.BytesIO(raw_data)) as gz:
+                    raw_data = gz.read()
 
             feed.ParseFromString(raw_data)
 
@@ -64,9 +81,9 @@ class GTFSRTClient:
 
                 vehicle = entity.vehicle
 
-                # Extract trip information
-                trip_id = vehicle.trip.trip_id if vehicle.HasField("trip") else None
-                route_id = vehicle.trip.route_id if vehicle.HasField("trip") else None
+                # Extract trip information (unset proto2 fields read as ""/0)
+                trip = vehicle.trip
+                trip_id = trip.trip_id
 
                 # Skip if no trip_id
                 if not trip_id:
@@ -75,8 +92,8 @@ class GTFSRTClient:
                 vehicle_dict = {
                     "entity_id": entity.id,
                     "trip_id": trip_id,
-                    "route_id": route_id or "",
-                    "timestamp": vehicle.timestamp if vehicle.HasField("timestamp") else 0,
+                    "route_id": trip.route_id,
+                    "timestamp": vehicle.timestamp,
                 }
 
                 # Extract position if available
@@ -120,7 +137,9 @@ class GTFSRTClient:
 
     async def _load_from_url(self, url: str) -> bytes:
         """Load GTFS-RT data from HTTP URL"""
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.content
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10.0, http2=True)
+
+        response = await self._client.get(url)
+        response.raise_for_status()
+        return response.content
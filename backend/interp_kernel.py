@@ -0,0 +1,152 @@
+"""
+Numba kernels for GTFS interpolation
+Segment search and linear interpolation over the loader's packed arrays
+"""
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba is optional; kernels then run as plain Python
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+
+@njit(cache=True, fastmath=True)
+def interp_trip(seg_end_sec, dep_sec, arr_sec, stop_idx, stop_lat, stop_lng, start, end, t, hint):
+    """
+    Locate and interpolate one trip at service day time t
+
+    Args:
+        seg_end_sec, dep_sec, arr_sec: Loader's packed per-event arrays
+        stop_idx: The trip's pattern stop indices
+        stop_lat, stop_lng: Loader's stop coordinate arrays
+        start, end: The trip's slice of the packed arrays
+        t: Current time in seconds since midnight
+        hint: Segment index found on the previous call for this trip (-1 if none)
+
+    Returns:
+        (from_idx, to_idx, dep_time, arr_time, progress, interpolated, lat, lng,
+        seg_idx); to_idx is -1 for a train held at its first/last stop, from_idx
+        is -1 if no position applies, seg_idx is the next call's hint
+    """
+
+    # Find current segment: the first one that has not ended yet
+    lo = start
+    hi = end - 1
+
+    # Linear seek from the previous segment: a train stays on it for tens of
+    # seconds, so this is usually 0-2 steps. Otherwise binary search.
+    if start <= hint < hi and (hint == start or seg_end_sec[hint - 1] < t):
+        lo = hint
+        while lo < hi and lo < hint + 2 and seg_end_sec[lo] < t:
+            lo += 1
+        if lo < hi and seg_end_sec[lo] >= t:
+            hi = lo
+
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if seg_end_sec[mid] < t:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    if lo < end - 1:
+        dep_time = np.int64(dep_sec[lo])
+        arr_time = np.int64(arr_sec[lo + 1])
+        from_idx = np.int64(stop_idx[lo - start])
+        to_idx = np.int64(stop_idx[lo - start + 1])
+
+        # Check if current time falls within this segment (both ends timed)
+        if (dep_time >= 0 and arr_time >= 0 and from_idx >= 0 and to_idx >= 0
+                and dep_time <= t and t <= arr_time):
+            # Calculate progress
+            duration = arr_time - dep_time
+            progress = 0.0
+            if duration > 0:
+                progress = min(1.0, max(0.0, (t - dep_time) / duration))
+
+            # Linear interpolation
+            lat = stop_lat[from_idx] + (stop_lat[to_idx] - stop_lat[from_idx]) * progress
+            lng = stop_lng[from_idx] + (stop_lng[to_idx] - stop_lng[from_idx]) * progress
+            return from_idx, to_idx, dep_time, arr_time, progress, True, lat, lng, lo
+
+    # No matching segment found -> fallback to first/last stop
+    # This can happen if the train is before first departure or after last arrival
+
+    first_dep = np.int64(dep_sec[start]) if dep_sec[start] > 0 else np.int64(0)
+    last_arr = np.int64(arr_sec[end - 1]) if arr_sec[end - 1] > 0 else np.int64(86400)
+    first_stop = np.int64(stop_idx[0])
+    last_stop = np.int64(stop_idx[end - start - 1])
+
+    # Before first departure -> show at first stop
+    if t < first_dep and first_stop >= 0:
+        return (first_stop, np.int64(-1), first_dep, first_dep, 0.0, False,
+                stop_lat[first_stop], stop_lng[first_stop], lo)
+
+    # After last arrival -> show at last stop
+    if t > last_arr and last_stop >= 0:
+        return (last_stop, np.int64(-1), last_arr, last_arr, 1.0, False,
+                stop_lat[last_stop], stop_lng[last_stop], lo)
+
+    return np.int64(-1), np.int64(-1), np.int64(0), np.int64(0), 0.0, False, 0.0, 0.0, lo
+
+
+@njit(cache=True, parallel=True, fastmath=True)
+def compute_positions(seg_end_sec, dep_sec, arr_sec, pattern_stop_idx,
+                      trip_start, trip_end, trip_pattern_start,
+                      stop_lat, stop_lng, rows, known, t, seg_hint):
+    """
+    Run interp_trip for many vehicles in parallel
+
+    Args:
+        seg_end_sec, dep_sec, arr_sec: Loader's packed per-event arrays
+        pattern_stop_idx: All stop patterns back to back
+        trip_start, trip_end, trip_pattern_start: Per-trip row offsets
+        stop_lat, stop_lng: Loader's stop coordinate arrays
+        rows: Trip row per vehicle
+        known: False for vehicles without a usable trip
+        t: Service day time per vehicle
+        seg_hint: Segment found on the previous call per trip row (-1 if none);
+            updated in place. Vehicles sharing a trip may race on their entry,
+            which is harmless since any hint only seeds the search
+
+    Returns:
+        Per-vehicle arrays (from_idx, to_idx, dep_time, arr_time, progress,
+        interpolated, lat, lng); from_idx is -1 where no position applies
+    """
+    n = len(rows)
+    from_idx = np.full(n, -1, dtype=np.int64)
+    to_idx = np.full(n, -1, dtype=np.int64)
+    dep_time = np.zeros(n, dtype=np.int64)
+    arr_time = np.zeros(n, dtype=np.int64)
+    progress = np.zeros(n, dtype=np.float64)
+    interpolated = np.zeros(n, dtype=np.bool_)
+    lat = np.zeros(n, dtype=np.float64)
+    lng = np.zeros(n, dtype=np.float64)
+
+    for v in prange(n):
+        if not known[v]:
+            continue
+        row = rows[v]
+        start = trip_start[row]
+        end = trip_end[row]
+        pattern_start = trip_pattern_start[row]
+        stop_idx = pattern_stop_idx[pattern_start:pattern_start + (end - start)]
+
+        result = interp_trip(seg_end_sec, dep_sec, arr_sec, stop_idx,
+                             stop_lat, stop_lng, start, end, t[v], seg_hint[row])
+        seg_hint[row] = result[8]
+        from_idx[v] = result[0]
+        to_idx[v] = result[1]
+        dep_time[v] = result[2]
+        arr_time[v] = result[3]
+        progress[v] = result[4]
+        interpolated[v] = result[5]
+        lat[v] = result[6]
+        lng[v] = result[7]
+
+    return from_idx, to_idx, dep_time, arr_time, progress, interpolated, lat, lng
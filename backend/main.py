@@ -2,12 +2,14 @@
 JR East Real-time Train Tracking System - Main Application (GTFS-RT Version)
 FastAPI server with SSE streaming using GTFS-RT + static GTFS
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sse_starlette.sse import EventSourceResponse
 import asyncio
-import json
-from datetime import datetime
+import time
+import orjson
+import numpy as np
 from pathlib import Path
 
 # Import our modules
@@ -22,7 +24,7 @@ from gtfs_rt_client import GTFSRTClient
 from gtfs_interpolator import GTFSInterpolator, get_service_day_start_epoch
 
 
-app = FastAPI(title="JR East Real-time Train Tracker (GTFS-RT)")
+app = FastAPI(title="JR East Real-time Train Tracker (GTFS-RT)", default_response_class=ORJSONResponse)
 
 # CORS
 app.add_middleware(
@@ -38,18 +40,40 @@ shapefile_loader = None
 gtfs_rt_client = None
 interpolator = None
 rail_paths = {}
+
+# Snapshot metadata; the vehicle columns are kept only in the encoded live_snapshot_json
 live_snapshot = {
     "seq": 0,
-    "vehicles": [],
+    "count": 0,
     "timestamp": 0,
     "service_day_start_epoch": 0,
     "current_time_sec": 0
 }
 
 
+def encode_json(payload) -> bytes:
+    """Serialize payload with orjson (NumPy arrays included)"""
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def sse_frame(event: str, data: bytes) -> bytes:
+    """Wrap encoded JSON as one complete SSE event; EventSourceResponse passes bytes through as-is"""
+    # orjson output is single-line, so it needs no data: line splitting
+    return b"event: " + event.encode() + b"\r\ndata: " + data + b"\r\n\r\n"
+
+
+# Pre-encoded SSE frames (encoded once, shared by every client)
+live_snapshot_json = encode_json({**live_snapshot, "vehicles": {}})
+live_snapshot_frame = sse_frame("snapshot", live_snapshot_json)
+rail_paths_frame = sse_frame("rail_paths", encode_json({}))
+
+# Set by poll_loop whenever a new snapshot is published; wakes all SSE clients
+snapshot_event = asyncio.Event()
+
+
 @app.on_event("startup")
 async def startup():
-    global gtfs_loader, shapefile_loader, gtfs_rt_client, interpolator, rail_paths
+    global gtfs_loader, shapefile_loader, gtfs_rt_client, interpolator, rail_paths, rail_paths_frame
 
     print("\n" + "="*60)
     print("JR East Real-time Train Tracking System (GTFS-RT)")
@@ -71,6 +95,7 @@ async def startup():
     )
     shapefile_stations = shapefile_loader.load_stations()
     rail_paths = shapefile_loader.load_rail_sections()
+    rail_paths_frame = sse_frame("rail_paths", encode_json(rail_paths))
 
     # Initialize GTFS-RT client
     print("\n[Startup] Initializing GTFS-RT client...")
@@ -97,9 +122,15 @@ async def startup():
     print("="*60 + "\n")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    if gtfs_rt_client is not None:
+        await gtfs_rt_client.aclose()
+
+
 async def poll_loop():
     """Poll GTFS-RT feed every N seconds"""
-    global live_snapshot
+    global live_snapshot, live_snapshot_json, live_snapshot_frame
 
     if gtfs_rt_client is None:
         print("[poll_loop] No GTFS-RT client configured, skipping polling")
@@ -111,77 +142,77 @@ async def poll_loop():
             rt_vehicles = await gtfs_rt_client.get_vehicles()
 
             service_start = get_service_day_start_epoch()
-            current_time = datetime.now().timestamp()
+            current_time = time.time()
+            current_time_i = int(current_time)
 
-            vehicles = []
-            success_count = 0
             fail_count = 0
 
-            # Process each vehicle
+            # Skip vehicles without trip/timestamp, then position the rest in one batch
+            valid_vehicles = []
             for rt_vehicle in rt_vehicles:
-                trip_id = rt_vehicle.get("trip_id")
-                timestamp = rt_vehicle.get("timestamp", 0)
-                entity_id = rt_vehicle.get("entity_id")
-
-                if not trip_id or not timestamp:
+                if not rt_vehicle.get("trip_id") or not rt_vehicle.get("timestamp", 0):
                     fail_count += 1
                     continue
-
-                # Calculate position using interpolator
-                position = interpolator.calculate_position(
-                    trip_id=trip_id,
-                    timestamp=timestamp,
-                    entity_id=entity_id
-                )
-
-                if position:
-                    # Calculate delay (difference between GTFS-RT timestamp and current time)
-                    # For now, we don't have explicit delay info in GTFS-RT, so set to 0
-                    delay_sec = 0
-
-                    vehicles.append({
-                        "trip_id": trip_id,
-                        "entity_id": entity_id,
-                        "lat": position["lat"],
-                        "lng": position["lng"],
-                        "progress": position["progress"],
-
-                        # GTFS stop IDs (compatible with frontend)
-                        "from_stop_gtfs": position.get("from_stop_id"),
-                        "to_stop_gtfs": position.get("to_stop_id"),
-
-                        "delay": delay_sec,
-                        "status": "IN_TRANSIT_TO",
-                        "interpolated": position["interpolated"],
-
-                        # Timing info
-                        "seg_dep_epoch": position.get("seg_dep_epoch", 0),
-                        "seg_arr_epoch": position.get("seg_arr_epoch", 0),
-                        "current_time_sec": position.get("current_time_sec", 0),
-                        "rt_age_sec": int(current_time - timestamp) if timestamp else 0,
-                    })
-
-                    if position["interpolated"]:
-                        success_count += 1
-                else:
-                    fail_count += 1
+                valid_vehicles.append(rt_vehicle)
+
+            trip_ids = [v["trip_id"] for v in valid_vehicles]
+            timestamps = np.array([v["timestamp"] for v in valid_vehicles], dtype=np.int64)
+
+            # Calculate positions using interpolator
+            columns = interpolator.calculate_positions_columns(trip_ids, timestamps)
+            slots = columns["slot"]
+            fail_count += len(valid_vehicles) - len(slots)
+            success_count = int(np.count_nonzero(columns["interpolated"][slots]))
+
+            # For now, we don't have explicit delay info in GTFS-RT, so set to 0
+            delay = np.zeros(len(slots), dtype=np.int32)
+
+            # Columnar vehicles: one array per field instead of one dict per vehicle
+            stop_ids = interpolator.stop_ids
+            to_idx = columns["to_idx"][slots].tolist()
+            vehicles = {
+                "trip_id": [trip_ids[i] for i in slots.tolist()],
+                "entity_id": [valid_vehicles[i].get("entity_id") for i in slots.tolist()],
+                "lat": columns["lat"][slots].astype(np.float32),
+                "lng": columns["lng"][slots].astype(np.float32),
+                "progress": columns["progress"][slots].astype(np.float32),
+
+                # GTFS stop IDs (compatible with frontend)
+                "from_stop_gtfs": [stop_ids[i] for i in columns["from_idx"][slots].tolist()],
+                "to_stop_gtfs": [stop_ids[i] if i >= 0 else None for i in to_idx],
+
+                "delay": delay,
+                "interpolated": columns["interpolated"][slots].astype(np.bool_),
+
+                # Timing info
+                "seg_dep_epoch": columns["seg_dep_epoch"][slots].astype(np.int64),
+                "seg_arr_epoch": columns["seg_arr_epoch"][slots].astype(np.int64),
+                # Seconds into the service day always fit int32; narrowed on purpose
+                "current_time_sec": columns["current_time_sec"][slots].astype(np.int32),
+                # Kept int64: a bogus feed timestamp can put the age outside int32
+                "rt_age_sec": (current_time_i - timestamps[slots]).astype(np.int64),
+            }
 
             # Update snapshot
             live_snapshot = {
                 "seq": live_snapshot["seq"] + 1,
                 "timestamp": current_time,
                 "service_day_start_epoch": service_start,
-                "current_time_sec": int(current_time % 86400),
-                "vehicles": vehicles,
+                "current_time_sec": current_time_i - service_start,
+                "count": len(slots),
             }
 
-            # Add rail paths only on first snapshot
-            if live_snapshot["seq"] == 1:
-                live_snapshot["rail_paths"] = rail_paths
+            # Serialize once per poll instead of once per SSE client
+            live_snapshot_json = encode_json({**live_snapshot, "vehicles": vehicles})
+            live_snapshot_frame = sse_frame("snapshot", live_snapshot_json)
+
+            # Wake SSE clients waiting for this snapshot
+            snapshot_event.set()
+            snapshot_event.clear()
 
             print(f"[poll_loop] Seq {live_snapshot['seq']} | "
                   f"RT vehicles: {len(rt_vehicles)} | "
-                  f"Positioned: {len(vehicles)} | "
+                  f"Positioned: {live_snapshot['count']} | "
                   f"Interpolated: {success_count} | "
                   f"Failed: {fail_count}")
 
@@ -197,28 +228,24 @@ async def poll_loop():
 async def stream_trains():
     """SSE endpoint for real-time train data"""
     async def event_generator():
-        last_seq = -1
-        rail_sent = False
-
-        while True:
-            if live_snapshot["seq"] > last_seq:
-                last_seq = live_snapshot["seq"]
+        last_frame = None
 
-                # Send snapshot
-                snapshot = live_snapshot.copy()
+        # Static rail geometry is sent once per connection
+        yield rail_paths_frame
 
-                # Only send rail_paths once
-                if rail_sent:
-                    snapshot.pop("rail_paths", None)
-                else:
-                    rail_sent = True
+        while True:
+            # poll_loop swaps in a new frame per snapshot, so identity marks a new one
+            frame = live_snapshot_frame
+            if frame is not last_frame:
+                last_frame = frame
 
-                yield {
-                    "event": "snapshot",
-                    "data": json.dumps(snapshot)
-                }
+                # Send the snapshot already serialized by poll_loop
+                yield frame
 
-            await asyncio.sleep(1)
+            # Sleep until poll_loop publishes the next snapshot. Re-check first: a
+            # snapshot published while the yield was sending was missed by wait()
+            if live_snapshot_frame is last_frame:
+                await snapshot_event.wait()
 
     return EventSourceResponse(
         event_generator(),
@@ -237,7 +264,7 @@ async def health():
         "version": "GTFS-RT",
         "gtfs_stops": len(gtfs_loader.stops) if gtfs_loader else 0,
         "gtfs_trips": len(gtfs_loader.stop_times) if gtfs_loader else 0,
-        "live_vehicles": len(live_snapshot["vehicles"]),
+        "live_vehicles": live_snapshot["count"],
         "last_update": live_snapshot.get("timestamp", 0)
     }
 
@@ -245,7 +272,8 @@ async def health():
 @app.get("/debug/last-snapshot")
 async def debug_snapshot():
     """Debug endpoint: return last snapshot"""
-    return live_snapshot
+    # Already encoded by poll_loop; served as-is
+    return Response(content=live_snapshot_json, media_type="application/json")
 
 
 @app.get("/")
@@ -2,13 +2,16 @@
 JR East Real-time Train Tracking System - Main Application (Debug Version)
 FastAPI server with SSE streaming
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sse_starlette.sse import EventSourceResponse
 import asyncio
-import json
+import time
+import httpx
+import numpy as np
+import orjson
 import os
-from datetime import datetime
 from pathlib import Path
 
 # Import our modules
@@ -25,7 +28,7 @@ from interpolator import Interpolator
 from odpt_client import ODPTClient
 
 
-app = FastAPI(title="JR East Real-time Train Tracker")
+app = FastAPI(title="JR East Real-time Train Tracker", default_response_class=ORJSONResponse)
 
 # CORS
 app.add_middleware(
@@ -45,16 +48,55 @@ odpt_client = None
 rail_paths = {}
 live_snapshot = {
     "seq": 0,
-    "vehicles": [],
+    "count": 0,
+    "vehicles": {},
     "timestamp": 0,
     "service_day_start_epoch": 0,
     "current_time_sec": 0
 }
 
 
+def encode_json(payload) -> bytes:
+    """Serialize payload with orjson (NumPy arrays included)"""
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def sse_frame(event: str, data: bytes) -> bytes:
+    """Wrap encoded JSON as one complete SSE event; EventSourceResponse passes bytes through as-is"""
+    # orjson output is single-line, so it needs no data: line splitting
+    return b"event: " + event.encode() + b"\r\ndata: " + data + b"\r\n\r\n"
+
+
+# Per-vehicle fields of the columnar snapshot, and the dtype of the numeric ones
+VEHICLE_COLUMNS = (
+    "trip_id", "lat", "lng", "progress", "from_stop_id", "to_stop_id",
+    "from_stop_gtfs", "to_stop_gtfs", "delay", "interpolated",
+    "seg_dep_epoch", "seg_arr_epoch", "match_score", "match_reason", "static_trip_id"
+)
+NUMERIC_COLUMNS = {
+    "lat": np.float32,
+    "lng": np.float32,
+    "progress": np.float32,
+    "delay": np.int32,
+    "interpolated": np.bool_,
+    "seg_dep_epoch": np.int64,
+    "seg_arr_epoch": np.int64,
+    "match_score": np.int64,
+}
+
+
+# Pre-encoded SSE frames (encoded once, shared by every client)
+live_snapshot_json = encode_json(live_snapshot)
+live_snapshot_frame = sse_frame("snapshot", live_snapshot_json)  # Re-encoded once per poll
+rail_paths_frame = sse_frame("rail_paths", encode_json({}))  # Encoded once at startup, sent as each client's first event
+
+# Set by poll_loop whenever a new snapshot is published; wakes all SSE clients
+snapshot_event = asyncio.Event()
+
+
 @app.on_event("startup")
 async def startup():
-    global gtfs_loader, shapefile_loader, station_mapper, trip_matcher, interpolator, odpt_client, rail_paths
+    global gtfs_loader, shapefile_loader, station_mapper, trip_matcher, interpolator, odpt_client, rail_paths, rail_paths_frame
 
     print("\n" + "="*60)
     print("JR East Real-time Train Tracking System (DEBUG MODE)")
@@ -81,22 +123,40 @@ async def startup():
     )
     shapefile_stations = shapefile_loader.load_stations()
     rail_paths = shapefile_loader.load_rail_sections()
+    rail_paths_frame = sse_frame("rail_paths", encode_json(rail_paths))
 
     # Initialize ODPT client
     print("\n[Startup] Initializing ODPT client...")
     print(f"[Startup] Using ODPT base URL: {ODPT_BASE_URL}")
-    odpt_client = ODPTClient(api_key=ODPT_API_KEY, railways=INITIAL_RAILWAYS, base_url=ODPT_BASE_URL)
+    # One pooled HTTP/2 client for the whole app (closed on shutdown)
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        timeout=10.0
+    )
+    odpt_client = ODPTClient(
+        api_key=ODPT_API_KEY,
+        railways=INITIAL_RAILWAYS,
+        base_url=ODPT_BASE_URL,
+        client=app.state.http
+    )
 
-    # Fetch ODPT stations
+    # Fetch ODPT stations (all railways concurrently)
     print("[Startup] Fetching ODPT stations...")
     odpt_stations = {}
-    for railway in INITIAL_RAILWAYS:
-        try:
-            stations = await odpt_client.get_stations(railway)
-            odpt_stations.update(stations)
-            print(f"[Startup] Fetched {len(stations)} stations for {railway}")
-        except Exception as e:
-            print(f"[Startup] Error fetching stations for {railway}: {e}")
+    results = await asyncio.gather(
+        *[odpt_client.get_stations(railway) for railway in INITIAL_RAILWAYS],
+        return_exceptions=True
+    )
+    for railway, stations in zip(INITIAL_RAILWAYS, results):
+        # Cancellation comes back as a result too; propagate it instead of skipping
+        if isinstance(stations, asyncio.CancelledError):
+            raise stations
+        if isinstance(stations, BaseException):
+            print(f"[Startup] Error fetching stations for {railway}: {stations}")
+            continue
+        odpt_stations.update(stations)
+        print(f"[Startup] Fetched {len(stations)} stations for {railway}")
 
     # Create station mapping
     print("\n[Startup] Creating station mapping...")
@@ -125,9 +185,17 @@ async def startup():
     print("="*60 + "\n")
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    if odpt_client is not None:
+        await odpt_client.aclose()
+    if getattr(app.state, "http", None) is not None:
+        await app.state.http.aclose()
+
+
 async def poll_loop():
     """Poll ODPT API every 3 seconds"""
-    global live_snapshot
+    global live_snapshot, live_snapshot_json, live_snapshot_frame
 
     while True:
         try:
@@ -137,7 +205,8 @@ async def poll_loop():
             current_time_sec = get_current_time_sec()
             service_start = get_service_day_start_epoch()
 
-            vehicles = []
+            # Columnar vehicles: one list per field, NumPy arrays for the numeric ones
+            vehicles = {name: [] for name in VEHICLE_COLUMNS}
             match_success = 0
             match_failed = {}
             skip_no_stops = 0
@@ -146,50 +215,47 @@ async def poll_loop():
             if live_snapshot["seq"] == 0 and trains:
                 print(f"\n{'='*60}")
                 print("[DEBUG] Sample train data (first train):")
-                print(f"{json.dumps(trains[0], indent=2)}")
+                print(orjson.dumps(trains[0], option=orjson.OPT_INDENT_2).decode())
                 print(f"{'='*60}\n")
 
             for train in trains:
-                if not train.get("from_stop") or not train.get("to_stop"):
+                if not train.from_stop or not train.to_stop:
                     skip_no_stops += 1
                     # DEBUG: Show skipped trains (first 3 only)
                     if live_snapshot["seq"] == 0 and skip_no_stops <= 3:
                         print(f"[DEBUG] SKIPPED (no stops):")
-                        print(f"  trip_id: {train.get('trip_id')}")
-                        print(f"  from_stop: {train.get('from_stop')}")
-                        print(f"  to_stop: {train.get('to_stop')}\n")
+                        print(f"  trip_id: {train.trip_id}")
+                        print(f"  from_stop: {train.from_stop}")
+                        print(f"  to_stop: {train.to_stop}\n")
                     continue
 
                 position = interpolator.calculate_position(
-                    train["trip_id"],
+                    train.trip_id,
                     current_time_sec,
-                    train["from_stop"],
-                    train["to_stop"],
-                    train["delay"]
+                    train.from_stop,
+                    train.to_stop,
+                    train.delay,
+                    service_start=service_start
                 )
 
                 if position:
-                    vehicles.append({
-                        "trip_id": train["trip_id"],
-                        "lat": position["lat"],
-                        "lng": position["lng"],
-                        "progress": position["progress"],
-                        "from_stop_id": train["from_stop"],
-                        "to_stop_id": train["to_stop"],
-                        "from_stop_gtfs": position.get("from_stop_gtfs"),
-                        "to_stop_gtfs": position.get("to_stop_gtfs"),
-                        "delay": train["delay"],
-                        "status": "IN_TRANSIT_TO",
-                        "interpolated": position["interpolated"],
-
-                        # Debug info
-                        "seg_dep_epoch": position["seg_dep_epoch"],
-                        "seg_arr_epoch": position["seg_arr_epoch"],
-                        "match_score": position["match_score"],
-                        "match_reason": position["match_reason"],
-                        "static_trip_id": position["static_trip_id"],
-                        "rt_age_sec": 0
-                    })
+                    vehicles["trip_id"].append(train.trip_id)
+                    vehicles["lat"].append(position["lat"])
+                    vehicles["lng"].append(position["lng"])
+                    vehicles["progress"].append(position["progress"])
+                    vehicles["from_stop_id"].append(train.from_stop)
+                    vehicles["to_stop_id"].append(train.to_stop)
+                    vehicles["from_stop_gtfs"].append(position.get("from_stop_gtfs"))
+                    vehicles["to_stop_gtfs"].append(position.get("to_stop_gtfs"))
+                    vehicles["delay"].append(train.delay)
+                    vehicles["interpolated"].append(position["interpolated"])
+
+                    # Debug info
+                    vehicles["seg_dep_epoch"].append(position["seg_dep_epoch"])
+                    vehicles["seg_arr_epoch"].append(position["seg_arr_epoch"])
+                    vehicles["match_score"].append(position["match_score"])
+                    vehicles["match_reason"].append(position["match_reason"])
+                    vehicles["static_trip_id"].append(position["static_trip_id"])
 
                     if position["interpolated"]:
                         match_success += 1
@@ -199,22 +265,30 @@ async def poll_loop():
                     # DEBUG: Show failed matches (first 3 only)
                     if live_snapshot["seq"] == 0 and match_failed.get(reason, 0) <= 3:
                         print(f"[DEBUG] POSITION FAILED:")
-                        print(f"  trip_id: {train['trip_id']}")
-                        print(f"  from_stop: {train['from_stop']}")
-                        print(f"  to_stop: {train['to_stop']}\n")
+                        print(f"  trip_id: {train.trip_id}")
+                        print(f"  from_stop: {train.from_stop}")
+                        print(f"  to_stop: {train.to_stop}\n")
+
+            count = len(vehicles["trip_id"])
+            for name, dtype in NUMERIC_COLUMNS.items():
+                vehicles[name] = np.array(vehicles[name], dtype=dtype)
+            vehicles["rt_age_sec"] = np.zeros(count, dtype=np.int32)
 
             # Update snapshot
             live_snapshot = {
                 "seq": live_snapshot["seq"] + 1,
-                "timestamp": datetime.now().timestamp(),
+                "count": count,
+                "timestamp": time.time(),
                 "service_day_start_epoch": service_start,
                 "current_time_sec": current_time_sec,
                 "vehicles": vehicles,
             }
+            live_snapshot_json = encode_json(live_snapshot)
+            live_snapshot_frame = sse_frame("snapshot", live_snapshot_json)
 
-            # Add rail paths only on first snapshot
-            if live_snapshot["seq"] == 1:
-                live_snapshot["rail_paths"] = rail_paths
+            # Wake SSE clients waiting for this snapshot
+            snapshot_event.set()
+            snapshot_event.clear()
 
             print(f"[poll_loop] Seq {live_snapshot['seq']} | "
                   f"Fetched {len(trains)} trains | "
@@ -234,28 +308,24 @@ async def poll_loop():
 async def stream_trains():
     """SSE endpoint for real-time train data"""
     async def event_generator():
-        last_seq = -1
-        rail_sent = False
-
-        while True:
-            if live_snapshot["seq"] > last_seq:
-                last_seq = live_snapshot["seq"]
+        last_frame = None
 
-                # Send snapshot
-                snapshot = live_snapshot.copy()
+        # Static rail geometry is sent once per connection
+        yield rail_paths_frame
 
-                # Only send rail_paths once
-                if rail_sent:
-                    snapshot.pop("rail_paths", None)
-                else:
-                    rail_sent = True
+        while True:
+            # poll_loop swaps in a new frame per snapshot, so identity marks a new one
+            frame = live_snapshot_frame
+            if frame is not last_frame:
+                last_frame = frame
 
-                yield {
-                    "event": "snapshot",
-                    "data": json.dumps(snapshot)
-                }
+                # Send the snapshot already serialized by poll_loop
+                yield frame
 
-            await asyncio.sleep(1)
+            # Sleep until poll_loop publishes the next snapshot. Re-check first: a
+            # snapshot published while the yield was sending was missed by wait()
+            if live_snapshot_frame is last_frame:
+                await snapshot_event.wait()
 
     return EventSourceResponse(
         event_generator(),
@@ -274,7 +344,8 @@ async def health():
         "gtfs_stops": len(gtfs_loader.stops) if gtfs_loader else 0,
         "gtfs_trips": len(gtfs_loader.stop_times) if gtfs_loader else 0,
         "odpt_stations": len(station_mapper.odpt_stations) if station_mapper else 0,
-        "live_vehicles": len(live_snapshot["vehicles"]),
+        "live_vehicles": live_snapshot["count"],
+        "match_cache": trip_matcher.cache_stats() if trip_matcher else None,
         "last_update": live_snapshot.get("timestamp", 0)
     }
 
@@ -282,7 +353,8 @@ async def health():
 @app.get("/debug/last-snapshot")
 async def debug_snapshot():
     """Debug endpoint: return last snapshot"""
-    return live_snapshot
+    # Already encoded by poll_loop; served as-is
+    return Response(content=live_snapshot_json, media_type="application/json")
 
 
 @app.get("/")
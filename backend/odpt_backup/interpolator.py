@@ -3,7 +3,7 @@ Position Interpolator
 Calculates train position between stations based on timetable
 """
 from typing import Dict
-from trip_matcher import time_to_seconds, get_service_day_start_epoch
+from trip_matcher import get_service_day_start_epoch
 
 
 class Interpolator:
@@ -18,7 +18,8 @@ class Interpolator:
         current_time_sec: int,
         from_stop_odpt: str,
         to_stop_odpt: str,
-        delay_sec: int
+        delay_sec: int,
+        service_start: int | None = None
     ) -> Dict | None:
         """
         Calculate train position between stations
@@ -29,6 +30,8 @@ class Interpolator:
             from_stop_odpt: Origin station (ODPT ID)
             to_stop_odpt: Destination station (ODPT ID)
             delay_sec: Delay in seconds
+            service_start: Service day start epoch, computed once per poll by
+                the caller (looked up here if omitted)
 
         Returns:
             Position dict with:
@@ -74,10 +77,11 @@ class Interpolator:
                 }
             return None
 
-        # Get stop_times
-        stop_times = self.gtfs.stop_times.get(static_trip_id, [])
-        if not stop_times:
+        # Get the trip's span in the packed stop_times arrays
+        offsets = self.gtfs.trip_offsets.get(static_trip_id)
+        if not offsets or offsets[0] == offsets[1]:
             return None
+        start = offsets[0]
 
         # Convert ODPT -> GTFS stop IDs
         from_stop_gtfs = self.mapper.get_gtfs_stop_id(from_stop_odpt)
@@ -86,28 +90,22 @@ class Interpolator:
         if not from_stop_gtfs or not to_stop_gtfs:
             return None
 
-        # Find segment indices
-        idx_from = -1
-        idx_to = -1
-
-        for i, st in enumerate(stop_times):
-            if st["stop_id"] == from_stop_gtfs:
-                idx_from = i
-            if st["stop_id"] == to_stop_gtfs:
-                idx_to = i
+        # Find segment indices (O(1) per-trip lookup)
+        stop_index = self.gtfs.stop_index[static_trip_id]
+        idx_from = stop_index.get(from_stop_gtfs, -1)
+        idx_to = stop_index.get(to_stop_gtfs, -1)
 
         if idx_from < 0 or idx_to < 0 or idx_from >= idx_to:
             return None
 
-        # Get segment times
-        from_st = stop_times[idx_from]
-        to_st = stop_times[idx_to]
-
-        dep_time = time_to_seconds(from_st["departure_time"]) + delay_sec
-        arr_time = time_to_seconds(to_st["arrival_time"]) + delay_sec
+        # Get segment times (-1 if untimed)
+        dep_time, arr_time = self.matcher.event_times(start + idx_from, start + idx_to)
+        dep_time += delay_sec
+        arr_time += delay_sec
 
         # Convert to epoch time
-        service_start = get_service_day_start_epoch()
+        if service_start is None:
+            service_start = get_service_day_start_epoch()
         seg_dep_epoch = service_start + dep_time
         seg_arr_epoch = service_start + arr_time
 
@@ -4,52 +4,112 @@ Fetches real-time train data from Open Data Challenge for Public Transportation
 """
 import httpx
 import asyncio
-from typing import List, Dict
+import time
+import orjson
+from dataclasses import dataclass
+from typing import List, Dict, Optional
+
+
+@dataclass(slots=True)
+class ODPTTrain:
+    """One train from odpt:Train (orjson serializes it as a dict)"""
+    trip_id: Optional[str]  # ODPT trip identifier
+    from_stop: Optional[str]  # Departing station ID
+    to_stop: Optional[str]  # Arriving station ID
+    delay: int  # Delay in seconds
+    train_number: str
+    railway: str  # Railway ID
 
 
 class ODPTClient:
-    def __init__(self, api_key: str, railways: List[str], base_url: str = "https://api-tokyochallenge.odpt.org/api/v4"):
+    def __init__(
+        self,
+        api_key: str,
+        railways: List[str],
+        base_url: str = "https://api-tokyochallenge.odpt.org/api/v4",
+        client: Optional[httpx.AsyncClient] = None
+    ):
+        """
+        Initialize ODPT client
+
+        Args:
+            api_key: ODPT consumer key
+            railways: Railway IDs to poll
+            base_url: ODPT API base URL
+            client: Application-wide HTTP client to share (closed by its owner);
+                one is created lazily if omitted
+        """
         self.api_key = api_key
         self.base_url = base_url
         self.railways = railways
-        self.consecutive_failures = 0
-        self.backoff_sec = 3
 
-    async def get_trains(self) -> List[Dict]:
+        # Backoff is tracked per railway so one failing railway doesn't stall the others
+        self.consecutive_failures: Dict[str, int] = {}
+        self.backoff_sec: Dict[str, int] = {}
+        self._retry_at: Dict[str, float] = {}  # railway -> monotonic time of next attempt
+
+        # One pooled client shared by all requests
+        self._client = client
+        self._owns_client = client is None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it on first use"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=True,
+                timeout=10.0,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+            )
+        return self._client
+
+    async def aclose(self):
+        """Close the underlying HTTP client (only if this client created it)"""
+        if self._client is not None and self._owns_client:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_trains(self) -> List[ODPTTrain]:
         """
         Get train data for all configured railways
 
         Returns:
-            List of train dictionaries with:
-            - trip_id: ODPT trip identifier
-            - from_stop: Departing station ID
-            - to_stop: Arriving station ID
-            - delay: Delay in seconds
-            - train_number: Train number
-            - railway: Railway ID
+            List of ODPTTrain for every railway fetched
         """
         all_trains = []
 
-        for railway in self.railways:
-            try:
-                trains = await self._fetch_railway(railway)
-                all_trains.extend(trains)
-                self.consecutive_failures = 0
-                self.backoff_sec = 3
-            except Exception as e:
-                print(f"[ODPT] Failed to fetch {railway}: {e}")
+        # Fetch all railways concurrently, skipping those still backing off
+        now = time.monotonic()
+        railways = [r for r in self.railways if self._retry_at.get(r, 0) <= now]
+        results = await asyncio.gather(
+            *[self._fetch_railway(railway) for railway in railways],
+            return_exceptions=True
+        )
+
+        for railway, trains in zip(railways, results):
+            # Cancellation comes back as a result too; propagate it instead of backing off
+            if isinstance(trains, asyncio.CancelledError):
+                raise trains
+            if isinstance(trains, BaseException):
+                print(f"[ODPT] Failed to fetch {railway}: {trains}")
                 print(f"[ODPT] Error details:")
                 import traceback
-                traceback.print_exc()
-                self.consecutive_failures += 1
+                traceback.print_exception(trains)
+                self.consecutive_failures[railway] = self.consecutive_failures.get(railway, 0) + 1
 
                 # Exponential backoff (max 30 seconds)
-                self.backoff_sec = min(30, self.backoff_sec * 2)
-                await asyncio.sleep(self.backoff_sec)
+                self.backoff_sec[railway] = min(30, self.backoff_sec.get(railway, 3) * 2)
+                self._retry_at[railway] = time.monotonic() + self.backoff_sec[railway]
+                print(f"[ODPT] Retrying {railway} in {self.backoff_sec[railway]}s")
+                continue
+
+            self.consecutive_failures.pop(railway, None)
+            self.backoff_sec.pop(railway, None)
+            self._retry_at.pop(railway, None)
+            all_trains.extend(trains)
 
         return all_trains
 
-    async def _fetch_railway(self, railway_id: str) -> List[Dict]:
+    async def _fetch_railway(self, railway_id: str) -> List[ODPTTrain]:
         """Fetch train data for a specific railway"""
         url = f"{self.base_url}/odpt:Train"
         params = {
@@ -61,32 +121,32 @@ class ODPTClient:
         print(f"[ODPT]   URL: {url}")
         print(f"[ODPT]   Params: {params}")
 
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, params=params)
+        response = await self._get_client().get(url, params=params)
 
-            print(f"[ODPT]   Status: {response.status_code}")
-            
-            if response.status_code == 429:
-                raise Exception("Rate limited (429)")
+        print(f"[ODPT]   Status: {response.status_code}")
 
-            response.raise_for_status()
-            data = response.json()
+        if response.status_code == 429:
+            raise Exception("Rate limited (429)")
 
-            print(f"[ODPT]   Received {len(data)} trains")
+        response.raise_for_status()
+        data = orjson.loads(response.content)
 
-            # Normalize data
-            trains = []
-            for train in data:
-                trains.append({
-                    "trip_id": train.get("owl:sameAs") or train.get("odpt:train"),
-                    "from_stop": train.get("odpt:fromStation"),
-                    "to_stop": train.get("odpt:toStation"),
-                    "delay": train.get("odpt:delay", 0),
-                    "train_number": train.get("odpt:trainNumber", ""),
-                    "railway": railway_id
-                })
+        print(f"[ODPT]   Received {len(data)} trains")
 
-            return trains
+        # Normalize data in one pass
+        trains = [
+            ODPTTrain(
+                train.get("owl:sameAs") or train.get("odpt:train"),
+                train.get("odpt:fromStation"),
+                train.get("odpt:toStation"),
+                train.get("odpt:delay", 0),
+                train.get("odpt:trainNumber", ""),
+                railway_id
+            )
+            for train in data
+        ]
+
+        return trains
 
     async def get_stations(self, railway_id: str) -> Dict[str, dict]:
         """
@@ -106,33 +166,32 @@ class ODPTClient:
         print(f"[ODPT]   Params: {params}")
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, params=params)
-                
-                print(f"[ODPT]   Status: {response.status_code}")
-                print(f"[ODPT]   Response headers: {dict(response.headers)}")
-                
-                # 詳細なレスポンス内容を表示
-                if response.status_code != 200:
-                    print(f"[ODPT]   Response text: {response.text[:500]}")  # 最初の500文字
-                
-                response.raise_for_status()
-                data = response.json()
-
-                print(f"[ODPT]   Received {len(data)} stations")
-
-                stations = {}
-                for station in data:
-                    station_id = station.get("owl:sameAs")
-                    if station_id and station.get("geo:lat") and station.get("geo:long"):
-                        stations[station_id] = {
-                            "lat": float(station["geo:lat"]),
-                            "lon": float(station["geo:long"]),
-                            "name": station.get("dc:title", "")
-                        }
-
-                return stations
-                
+            response = await self._get_client().get(url, params=params)
+
+            print(f"[ODPT]   Status: {response.status_code}")
+            print(f"[ODPT]   Response headers: {dict(response.headers)}")
+
+            # 詳細なレスポンス内容を表示
+            if response.status_code != 200:
+                print(f"[ODPT]   Response text: {response.text[:500]}")  # 最初の500文字
+
+            response.raise_for_status()
+            data = orjson.loads(response.content)
+
+            print(f"[ODPT]   Received {len(data)} stations")
+
+            stations = {}
+            for station in data:
+                station_id = station.get("owl:sameAs")
+                if station_id and station.get("geo:lat") and station.get("geo:long"):
+                    stations[station_id] = {
+                        "lat": float(station["geo:lat"]),
+                        "lon": float(station["geo:long"]),
+                        "name": station.get("dc:title", "")
+                    }
+
+            return stations
+
         except httpx.HTTPStatusError as e:
             print(f"[ODPT] HTTP Error fetching stations for {railway_id}:")
             print(f"  Status: {e.response.status_code}")
@@ -4,10 +4,39 @@ Maps station IDs between ODPT and GTFS using coordinate-based matching and overr
 """
 import math
 import json
+import numpy as np
 from pathlib import Path
 from typing import Dict
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba is optional; functions then run as plain Python
+    NUMBA_AVAILABLE = False
+    prange = range
 
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+try:
+    from scipy.spatial import cKDTree
+    SCIPY_AVAILABLE = True
+except ImportError:  # scipy is optional; matching then uses the squared chord scan
+    SCIPY_AVAILABLE = False
+
+
+R = 6371  # Earth radius in km
+
+
+@njit(cache=True, fastmath=True)
+def _haversine_pre(lat1, lon1, cos_lat1, lat2, lon2, cos_lat2):
+    """Haversine distance in kilometers from radians and precomputed cos(latitude)"""
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         cos_lat1 * cos_lat2 * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * R * math.asin(math.sqrt(a))
+
+
+@njit(cache=True)
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
     Calculate distance between two points in kilometers using Haversine formula
@@ -19,19 +48,76 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     Returns:
         Distance in kilometers
     """
-    R = 6371  # Earth radius in km
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (math.sin(dlat/2)**2 +
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-         math.sin(dlon/2)**2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
+    lat1 = math.radians(lat1)
+    lat2 = math.radians(lat2)
+    return _haversine_pre(lat1, math.radians(lon1), math.cos(lat1),
+                          lat2, math.radians(lon2), math.cos(lat2))
+
+
+@njit(cache=True, fastmath=True, parallel=True)
+def nearest_by_chord(xyz_a, lat_a, lon_a, cos_a, xyz_b, lat_b, lon_b, cos_b):
+    """
+    Nearest point of set b for every point of set a, with its haversine distance.
+    Set b must not be empty
+
+    Args:
+        xyz_a, xyz_b: (N, 3) unit-sphere Cartesian positions
+        lat_*, lon_*, cos_*: The same points in radians, with cos(latitude)
+
+    Compares squared chord lengths, which order points like great-circle
+    distance without any trigonometry; the first point wins ties. The
+    haversine then runs once, for the winner.
+
+    Returns:
+        (index into b, distance in km) arrays aligned with a
+    """
+    nearest = np.empty(len(xyz_a), dtype=np.int64)
+    distance = np.empty(len(xyz_a))
+    for i in prange(len(xyz_a)):
+        # Seed from the first point: fastmath assumes no infinities, so no np.inf sentinel
+        dx = xyz_a[i, 0] - xyz_b[0, 0]
+        dy = xyz_a[i, 1] - xyz_b[0, 1]
+        dz = xyz_a[i, 2] - xyz_b[0, 2]
+        best = 0
+        best_d2 = dx * dx + dy * dy + dz * dz
+        for j in range(1, len(xyz_b)):
+            dx = xyz_a[i, 0] - xyz_b[j, 0]
+            dy = xyz_a[i, 1] - xyz_b[j, 1]
+            dz = xyz_a[i, 2] - xyz_b[j, 2]
+            d2 = dx * dx + dy * dy + dz * dz
+            if d2 < best_d2:
+                best_d2 = d2
+                best = j
+        nearest[i] = best
+        distance[i] = _haversine_pre(lat_a[i], lon_a[i], cos_a[i], lat_b[best], lon_b[best], cos_b[best])
+    return nearest, distance
+
+
+def unit_sphere_xyz(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """(N, 3) Cartesian positions on the unit sphere for latitudes/longitudes in radians"""
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
 
 
 class StationMapper:
     def __init__(self, gtfs_loader, odpt_stations: Dict[str, dict], overrides_path: str = None):
         self.gtfs_stops = gtfs_loader.stops
+
+        # GTFS stop coordinates in radians, aligned with stop_ids, for vectorized matching
+        self._gtfs_ids = gtfs_loader.stop_ids
+        self._gtfs_lat = np.radians(gtfs_loader.stop_lat)
+        self._gtfs_lon = np.radians(gtfs_loader.stop_lng)
+        self._gtfs_cos_lat = np.cos(self._gtfs_lat)
+        self._gtfs_xyz = unit_sphere_xyz(self._gtfs_lat, self._gtfs_lon)
+
+        # k-d tree over unit-sphere positions: nearest chord is nearest great circle.
+        # Stops sharing coordinates go in once, as the first such stop (the scan's tie-break)
+        self._tree = None
+        if SCIPY_AVAILABLE and len(self._gtfs_ids):
+            latlon = np.stack([self._gtfs_lat, self._gtfs_lon], axis=-1)
+            _, self._tree_stop = np.unique(latlon, axis=0, return_index=True)
+            self._tree = cKDTree(self._gtfs_xyz[self._tree_stop])
+
         self.odpt_stations = odpt_stations
         self.odpt_to_gtfs: Dict[str, str] = {}
         self.overrides: Dict[str, str] = {}
@@ -55,32 +141,26 @@ class StationMapper:
         matched_500m = 0
         override_count = 0
 
+        # 1. Check overrides first; collect the rest for coordinate matching
+        pending = []
         for odpt_id, odpt_station in self.odpt_stations.items():
-            # 1. Check overrides first
             if odpt_id in self.overrides:
                 self.odpt_to_gtfs[odpt_id] = self.overrides[odpt_id]
                 override_count += 1
                 continue
 
-            # 2. Coordinate-based matching
-            best_match = None
-            best_distance = float('inf')
-
             odpt_lat = odpt_station.get("lat")
             odpt_lon = odpt_station.get("lon")
 
             if not odpt_lat or not odpt_lon:
                 continue
+            pending.append((odpt_id, odpt_lat, odpt_lon))
 
-            for gtfs_id, gtfs_stop in self.gtfs_stops.items():
-                distance = haversine_distance(
-                    odpt_lat, odpt_lon,
-                    gtfs_stop["lat"], gtfs_stop["lng"]
-                )
+        # 2. Coordinate-based matching: nearest GTFS stop for every station at once
+        best_idx, best_dist = self._nearest_gtfs_stops(pending)
 
-                if distance < best_distance:
-                    best_distance = distance
-                    best_match = gtfs_id
+        for (odpt_id, _, _), idx, best_distance in zip(pending, best_idx.tolist(), best_dist.tolist()):
+            best_match = self._gtfs_ids[idx]
 
             # Within 300m - good match
             if best_distance < 0.3:
@@ -96,6 +176,45 @@ class StationMapper:
         print(f"[Mapper] Mapped {matched_300m}/{total} stations (300m), "
               f"{matched_500m} (500m), {override_count} overrides")
 
+    def _nearest_gtfs_stops(self, stations) -> tuple:
+        """
+        Nearest GTFS stop for each (odpt_id, lat, lon)
+
+        Uses the k-d tree when scipy is installed, otherwise a squared chord
+        scan (parallel Numba kernel, or NumPy broadcasting without Numba).
+
+        Returns:
+            (index into stop_ids, distance in km) arrays aligned with stations
+        """
+        if not stations or not len(self._gtfs_ids):
+            empty = np.empty(0)
+            return empty.astype(np.int64), empty
+
+        coords = np.radians(np.array([(lat, lon) for _, lat, lon in stations], dtype=np.float64))
+        odpt_lat = coords[:, 0]
+        odpt_lon = coords[:, 1]
+
+        odpt_xyz = unit_sphere_xyz(odpt_lat, odpt_lon)
+        if self._tree is not None:
+            chord, nearest = self._tree.query(odpt_xyz, k=1)
+            return self._tree_stop[nearest], 2 * R * np.arcsin(np.minimum(chord / 2, 1.0))
+
+        # Pick the winner by squared chord, then run the haversine for it alone
+        if NUMBA_AVAILABLE:
+            return nearest_by_chord(
+                odpt_xyz, odpt_lat, odpt_lon, np.cos(odpt_lat),
+                self._gtfs_xyz, self._gtfs_lat, self._gtfs_lon, self._gtfs_cos_lat
+            )
+
+        d2 = ((odpt_xyz[:, None, :] - self._gtfs_xyz[None, :, :]) ** 2).sum(axis=-1)
+        best_idx = d2.argmin(axis=1)  # First stop on ties, like the strict < scan
+
+        gtfs_lat = self._gtfs_lat[best_idx]
+        a = (np.sin((gtfs_lat - odpt_lat) / 2) ** 2 +
+             np.cos(odpt_lat) * self._gtfs_cos_lat[best_idx] *
+             np.sin((self._gtfs_lon[best_idx] - odpt_lon) / 2) ** 2)
+        return best_idx, 2 * R * np.arcsin(np.sqrt(a))
+
     def get_gtfs_stop_id(self, odpt_station_id: str) -> str | None:
         """
         Get GTFS stop ID from ODPT station ID
@@ -0,0 +1,80 @@
+"""
+Standalone Test Script for the TripMatcher match cache
+Checks that expired entries are evicted even after a recent cache hit
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add odpt_backup to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import trip_matcher
+from trip_matcher import TripMatcher, CACHE_SWEEP_INTERVAL, CACHE_TTL_SEC
+
+
+class EmptyGTFS:
+    """Loader stand-in without trips (only the cache is exercised)"""
+    stop_times = {}
+    trip_offsets = {}
+    stop_index = {}
+    dep_sec = np.empty(0, dtype=np.int32)
+    arr_sec = np.empty(0, dtype=np.int32)
+
+
+def test_expired_entry_evicted_after_hit():
+    matcher = TripMatcher(EmptyGTFS(), station_mapper=None)
+
+    # Cached at t=0, hit at t=800: moved to the LRU end but still aged from t=0
+    stale_key = ("odpt.Train:JR-East.ChuoRapid.870T", "from", "to")
+    matcher._cache_put(stale_key, "1110870T", 0)
+    trip_id, debug_info = matcher.find_best_match(
+        "odpt.Train:JR-East.ChuoRapid.870T", 800, "from", "to"
+    )
+    assert trip_id == "1110870T" and debug_info["reason"] == "cache-hit"
+
+    # Fresh inserts after the TTL has passed trigger the age sweep
+    now = CACHE_TTL_SEC + 100
+    for i in range(CACHE_SWEEP_INTERVAL):
+        matcher._cache_put((f"odpt.Train:JR-East.Line.{i}T", "from", "to"), f"{i}T", now)
+
+    assert stale_key not in matcher.cache
+    assert len(matcher.cache) == CACHE_SWEEP_INTERVAL
+
+
+def test_entry_from_previous_day_expires():
+    matcher = TripMatcher(EmptyGTFS(), station_mapper=None)
+
+    # Cached just before midnight; after midnight the age would be negative
+    stale_key = ("odpt.Train:JR-East.ChuoRapid.870T", "from", "to")
+    matcher._cache_put(stale_key, "1110870T", 86000)
+    trip_id, debug_info = matcher.find_best_match(
+        "odpt.Train:JR-East.ChuoRapid.870T", 100, "from", "to"
+    )
+    assert debug_info.get("reason") != "cache-hit"
+    assert stale_key not in matcher.cache
+
+    # The age sweep also drops entries from the previous day
+    matcher._cache_put(stale_key, "1110870T", 86000)
+    for i in range(CACHE_SWEEP_INTERVAL - 1):
+        matcher._cache_put((f"odpt.Train:JR-East.Line.{i}T", "from", "to"), f"{i}T", 100)
+
+    assert stale_key not in matcher.cache
+
+
+def test_size_bound():
+    matcher = TripMatcher(EmptyGTFS(), station_mapper=None)
+    limit = trip_matcher.CACHE_MAX_ENTRIES
+    for i in range(limit + 10):
+        matcher._cache_put((f"{i}T", "from", "to"), f"{i}T", 0)
+
+    assert len(matcher.cache) == limit
+    assert ("0T", "from", "to") not in matcher.cache
+
+
+if __name__ == "__main__":
+    test_expired_entry_evicted_after_hit()
+    test_entry_from_previous_day_expires()
+    test_size_bound()
+    print("TripMatcher cache tests passed")
@@ -3,58 +3,105 @@ Trip Matcher: Match ODPT trip_id to GTFS static trip_id
 Uses scoring algorithm based on train number, time, and station sequence
 """
 import re
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 from typing import Tuple, Dict, List
 from datetime import datetime
-import pytz
+from zoneinfo import ZoneInfo
 
+import numpy as np
 
-JST = pytz.timezone('Asia/Tokyo')
 
+JST = ZoneInfo('Asia/Tokyo')
 
-def time_to_seconds(time_str: str) -> int:
+# Trailing train number in GTFS trip_ids: digits + uppercase letters
+_TRAIN_NUMBER_RE = re.compile(r'(\d+[A-Z]+)$')
+
+# Highest total of the station bonuses in find_best_match (from + to + order + within segment)
+MAX_STATION_BONUS = 10000 + 10000 + 1000 + 3000
+
+# Candidates whose first departure is this close to the current time are scored first
+CANDIDATE_WINDOW_SEC = 7200
+
+# Match cache: entries expire after CACHE_TTL_SEC, least recently used evicted past CACHE_MAX_ENTRIES
+CACHE_TTL_SEC = 900
+CACHE_MAX_ENTRIES = 4096
+
+# Full scan for expired entries every this many cache inserts (LRU order is not age order)
+CACHE_SWEEP_INTERVAL = 256
+
+
+def time_to_seconds(time_str) -> int:
     """
     Convert HH:MM:SS to seconds (supports 24+ hours)
     Returns -1 if invalid
     """
-    if not time_str or not time_str.strip():
+    if not isinstance(time_str, str) or not time_str.strip():
         return -1
-    
+
     try:
         parts = time_str.split(':')
         if len(parts) != 3:
             return -1
-        
+
         h, m, s = map(int, parts)
-        
+
         # Validate ranges
         if h < 0 or m < 0 or m >= 60 or s < 0 or s >= 60:
             return -1
-            
+
         return h * 3600 + m * 60 + s
-    except (ValueError, AttributeError):
+    except ValueError:
         return -1
 
 
+# Cached service day as [start_epoch, end_epoch); JST has no DST so a day is 86400s
+_day_cache = [0, 0]
+
+
 def get_current_time_sec() -> int:
     """Get current time in seconds since midnight (JST)"""
-    now = datetime.now(JST)
-    return now.hour * 3600 + now.minute * 60 + now.second
+    return int(time.time()) - get_service_day_start_epoch()
 
 
 def get_service_day_start_epoch() -> int:
     """Get service day start time as epoch seconds (JST midnight)"""
+    now_epoch = time.time()
+    if _day_cache[0] <= now_epoch < _day_cache[1]:
+        return _day_cache[0]
+
     now = datetime.now(JST)
     start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    return int(start_of_day.timestamp())
+    start_epoch = int(start_of_day.timestamp())
+    _day_cache[0] = start_epoch
+    _day_cache[1] = start_epoch + 86400
+    return start_epoch
 
 
 class TripMatcher:
     def __init__(self, gtfs_loader, station_mapper):
         self.gtfs = gtfs_loader
         self.mapper = station_mapper
-        self.cache: Dict[str, Tuple[str, int]] = {}  # rt_trip_id -> (static_trip_id, cached_time)
+        # (rt_trip_id, from_stop_odpt, to_stop_odpt) -> (static_trip_id, cached_time), in LRU order
+        self.cache: "OrderedDict[Tuple[str, str, str], Tuple[str, int]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._puts = 0
         self.train_number_index = self._build_index()
 
+        # event index -> seconds for the few events whose timetable strings the loader's
+        # arrays don't reproduce; timed strictly here (no arrival/departure fallback)
+        raw_times = getattr(self.gtfs, "raw_times", {})
+        self._raw_arr_sec = {k: time_to_seconds(arr) for k, (arr, _) in raw_times.items()}
+        self._raw_dep_sec = {k: time_to_seconds(dep) for k, (_, dep) in raw_times.items()}
+
+        # trip_id -> (start offset, first departure sec or -1), read once per candidate when scoring
+        self._trip_heads: Dict[str, Tuple[int, int]] = self._build_trip_heads()
+
+        # train_number -> (sorted first departures, bucket positions) for time-window pruning
+        self._departure_index: Dict[str, Tuple[List[int], List[int]]] = self._build_departure_index()
+
     def _build_index(self) -> Dict[str, List[str]]:
         """Build reverse index: train_number -> list of trip_ids"""
         print("[TripMatcher] Building train number index...")
@@ -74,6 +121,42 @@ class TripMatcher:
         
         return index
 
+    def _build_trip_heads(self) -> Dict[str, Tuple[int, int]]:
+        """Gather every trip's first departure from the packed arrays in one vectorized pass"""
+        trip_ids = list(self.gtfs.trip_offsets)
+        if not trip_ids or len(self.gtfs.dep_sec) == 0:
+            return {trip_id: (0, -1) for trip_id in trip_ids}
+
+        spans = np.array([self.gtfs.trip_offsets[t] for t in trip_ids], dtype=np.int64)
+        starts, ends = spans[:, 0], spans[:, 1]
+
+        # -1 for trips without stop_times as well as untimed first departures
+        safe_starts = np.minimum(starts, len(self.gtfs.dep_sec) - 1)
+        first_deps = np.where(starts < ends, self.gtfs.dep_sec[safe_starts], -1)
+
+        heads = dict(zip(trip_ids, zip(starts.tolist(), first_deps.tolist())))
+
+        # First departures given as missing or non-canonical strings
+        for trip_id, (start, first_dep) in heads.items():
+            if first_dep >= 0 and start in self._raw_dep_sec:
+                heads[trip_id] = (start, self._raw_dep_sec[start])
+        return heads
+
+    def _build_departure_index(self) -> Dict[str, Tuple[List[int], List[int]]]:
+        """Sort each train number bucket by first departure (trips without one are left out)"""
+        index = {}
+
+        for train_number, trip_ids in self.train_number_index.items():
+            departures = []
+            for position, trip_id in enumerate(trip_ids):
+                first_dep = self._trip_heads[trip_id][1]
+                if first_dep >= 0:
+                    departures.append((first_dep, position))
+            departures.sort()
+            index[train_number] = ([d for d, _ in departures], [p for _, p in departures])
+
+        return index
+
     def _extract_train_number(self, trip_id: str) -> str:
         """
         Extract train number from trip_id
@@ -87,11 +170,11 @@ class TripMatcher:
         """
         if '.' in trip_id:
             # ODPT format: "odpt.Train:JR-East.ChuoRapid.870T"
-            return trip_id.split('.')[-1]
+            return trip_id.rpartition('.')[2]
 
         # GTFS format: "1110870T", "4210820G"
         # Extract trailing pattern: digits + uppercase letters
-        match = re.search(r'(\d+[A-Z]+)$', trip_id)
+        match = _TRAIN_NUMBER_RE.search(trip_id)
         if match:
             return match.group(1)
 
@@ -117,18 +200,23 @@ class TripMatcher:
             Tuple of (matched_trip_id, debug_info)
         """
 
-        # Check cache (TTL: 15 minutes)
-        if rt_trip_id in self.cache:
-            cached_trip, cached_time = self.cache[rt_trip_id]
+        # Check cache (TTL: 15 minutes). The key includes the segment, so a
+        # direction change is simply a miss
+        cache_key = (rt_trip_id, from_stop_odpt, to_stop_odpt)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            cached_trip, cached_time = cached
             age = current_time_sec - cached_time
 
-            if age > 900:  # 15 minutes expired
-                del self.cache[rt_trip_id]
-            elif self._is_cache_valid(cached_trip, from_stop_odpt, to_stop_odpt):
-                return cached_trip, {"reason": "cache-hit", "age_sec": age}
+            # Times are seconds since midnight, so a negative age means the
+            # entry was cached on the previous service day
+            if not 0 <= age <= CACHE_TTL_SEC:
+                del self.cache[cache_key]
             else:
-                # Direction changed -> invalidate
-                del self.cache[rt_trip_id]
+                self.cache.move_to_end(cache_key)
+                self._hits += 1
+                return cached_trip, {"reason": "cache-hit", "age_sec": age}
+        self._misses += 1
 
         # Extract train number
         train_number = self._extract_train_number(rt_trip_id)
@@ -143,33 +231,84 @@ class TripMatcher:
         from_stop_gtfs = self.mapper.get_gtfs_stop_id(from_stop_odpt)
         to_stop_gtfs = self.mapper.get_gtfs_stop_id(to_stop_odpt)
 
-        # Scoring
-        best_trip = None
-        best_score = -float('inf')
+        # Score the candidates departing near the current time first. Anything
+        # outside the window scores below MAX_STATION_BONUS - CANDIDATE_WINDOW_SEC,
+        # so the full bucket is only needed when the window's best is lower
+        window = self._candidates_in_window(train_number, current_time_sec)
+        best_trip, best_score = self._score_candidates(
+            window, current_time_sec, from_stop_gtfs, to_stop_gtfs
+        )
+        if best_score < MAX_STATION_BONUS - CANDIDATE_WINDOW_SEC and len(window) < len(candidates):
+            best_trip, best_score = self._score_candidates(
+                candidates, current_time_sec, from_stop_gtfs, to_stop_gtfs
+            )
+
+        # Cache result
+        if best_trip:
+            self._cache_put(cache_key, best_trip, current_time_sec)
+
+        debug_info = {
+            "reason": "matched" if best_trip else "low-score",
+            "score": best_score,
+            "candidates": len(candidates),
+            "match_details": "time+from+to+order" if best_score > 20000 else "partial"
+        }
+
+        return best_trip, debug_info
 
-        for candidate_id in candidates:
-            stop_times = self.gtfs.stop_times.get(candidate_id, [])
-            if not stop_times:
-                continue
+    def _candidates_in_window(self, train_number: str, current_time_sec: int) -> List[str]:
+        """Candidates first departing within CANDIDATE_WINDOW_SEC of now, in bucket order"""
+        firsts, positions = self._departure_index.get(train_number, ([], []))
+        lo = bisect_left(firsts, current_time_sec - CANDIDATE_WINDOW_SEC)
+        hi = bisect_right(firsts, current_time_sec + CANDIDATE_WINDOW_SEC)
 
-            # First departure time
-            first_dep = time_to_seconds(stop_times[0]["departure_time"])
-            if first_dep < 0:  # Invalid time
-                continue
+        # Bucket order keeps the first-listed trip winning ties, as in a full scan
+        trip_ids = self.train_number_index[train_number]
+        return [trip_ids[p] for p in sorted(positions[lo:hi])]
 
-            # Time proximity score (closer is better)
-            time_diff = abs(current_time_sec - first_dep)
-            score = -time_diff
+    def _score_candidates(
+        self,
+        candidates: List[str],
+        current_time_sec: int,
+        from_stop_gtfs: str | None,
+        to_stop_gtfs: str | None
+    ) -> Tuple[str | None, float]:
+        """
+        Score candidate trips by time proximity and station order
 
-            # Station matching
-            idx_from = -1
-            idx_to = -1
+        Returns:
+            (best trip_id or None, its score; -inf if no candidate was scored)
+        """
+        # Parsed seconds from the loader's packed stop_times arrays (-1 if untimed).
+        # Bound to locals so the scoring closure does no attribute lookups
+        dep_sec = self.gtfs.dep_sec
+        arr_sec = self.gtfs.arr_sec
+        get_head = self._trip_heads.get
+        get_stop_index = self.gtfs.stop_index.get
+        raw_dep_get = self._raw_dep_sec.get
+        raw_arr_get = self._raw_arr_sec.get
+        unscored = -float('inf')
+
+        def score_of(candidate_id: str) -> float:
+            """Score one candidate (-inf if it can't be scored)"""
+            head = get_head(candidate_id)
+            if head is None:  # Unknown trip
+                return unscored
+            start, first_dep = head
+
+            # First departure time (-1 if no stop_times or invalid time)
+            if first_dep < 0:
+                return unscored
 
-            for i, st in enumerate(stop_times):
-                if st["stop_id"] == from_stop_gtfs:
-                    idx_from = i
-                if st["stop_id"] == to_stop_gtfs:
-                    idx_to = i
+            # Time proximity score (closer is better)
+            score = -abs(current_time_sec - first_dep)
+
+            # Station matching (last visit of each stop, O(1) per-trip lookup)
+            stop_index = get_stop_index(candidate_id)
+            if stop_index is None:
+                return unscored
+            idx_from = stop_index.get(from_stop_gtfs, -1)
+            idx_to = stop_index.get(to_stop_gtfs, -1)
 
             # Station match bonuses
             if idx_from >= 0:
@@ -183,12 +322,16 @@ class TripMatcher:
                     score += 1000  # Correct order
 
                     # Check if within segment
-                    dep_time = time_to_seconds(stop_times[idx_from]["departure_time"])
-                    arr_time = time_to_seconds(stop_times[idx_to]["arrival_time"])
-                    
+                    dep_time = raw_dep_get(start + idx_from)
+                    if dep_time is None:
+                        dep_time = int(dep_sec[start + idx_from])
+                    arr_time = raw_arr_get(start + idx_to)
+                    if arr_time is None:
+                        arr_time = int(arr_sec[start + idx_to])
+
                     # Skip if invalid times
                     if dep_time < 0 or arr_time < 0:
-                        continue
+                        return unscored
 
                     # Too short segment -> penalty (exclude stop-only trips)
                     duration = arr_time - dep_time
@@ -201,45 +344,48 @@ class TripMatcher:
                 else:
                     score -= 10000  # Wrong order
 
-            if score > best_score:
-                best_score = score
-                best_trip = candidate_id
-
-        # Cache result
-        if best_trip:
-            self.cache[rt_trip_id] = (best_trip, current_time_sec)
-
-        debug_info = {
-            "reason": "matched" if best_trip else "low-score",
-            "score": best_score,
-            "candidates": len(candidates),
-            "match_details": "time+from+to+order" if best_score > 20000 else "partial"
-        }
-
-        return best_trip, debug_info
-
-    def _is_cache_valid(
-        self,
-        cached_trip: str,
-        from_stop_odpt: str,
-        to_stop_odpt: str
-    ) -> bool:
-        """Check if cached trip is still valid for current segment"""
-        stop_times = self.gtfs.stop_times.get(cached_trip)
-        if not stop_times:
-            return False
-
-        from_stop_gtfs = self.mapper.get_gtfs_stop_id(from_stop_odpt)
-        to_stop_gtfs = self.mapper.get_gtfs_stop_id(to_stop_odpt)
-
-        if not from_stop_gtfs or not to_stop_gtfs:
-            return False
-
-        # Check station order
-        stop_ids = [st["stop_id"] for st in stop_times]
-        try:
-            idx_from = stop_ids.index(from_stop_gtfs)
-            idx_to = stop_ids.index(to_stop_gtfs)
-            return idx_from < idx_to  # Valid if correct order
-        except ValueError:
-            return False  # Station not found = invalid
\ No newline at end of file
+            return score
+
+        # max() keeps the first of equal scores, like a strict > scan
+        best_trip = max(candidates, key=score_of, default=None)
+        if best_trip is None:
+            return None, unscored
+
+        # Score the winner once more for debug_info
+        best_score = score_of(best_trip)
+        if best_score == unscored:
+            return None, unscored
+        return best_trip, best_score
+
+    def event_times(self, dep_event: int, arr_event: int) -> Tuple[int, int]:
+        """Departure seconds of one stop event and arrival seconds of another (-1 if untimed)"""
+        raw_dep = self._raw_dep_sec.get(dep_event)
+        raw_arr = self._raw_arr_sec.get(arr_event)
+        dep_time = int(self.gtfs.dep_sec[dep_event]) if raw_dep is None else raw_dep
+        arr_time = int(self.gtfs.arr_sec[arr_event]) if raw_arr is None else raw_arr
+        return dep_time, arr_time
+
+    def _cache_put(self, cache_key: Tuple[str, str, str], trip_id: str, current_time_sec: int):
+        """Store a match, evicting least recently used entries past CACHE_MAX_ENTRIES
+        and, every CACHE_SWEEP_INTERVAL inserts, every expired entry"""
+        cache = self.cache
+        cache[cache_key] = (trip_id, current_time_sec)
+        cache.move_to_end(cache_key)
+
+        while len(cache) > CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+
+        # Hits move entries to the end without renewing cached_time, so an
+        # expired entry can sit behind fresh ones; sweep by age, not position
+        self._puts += 1
+        if self._puts % CACHE_SWEEP_INTERVAL == 0:
+            expired = [
+                key for key, (_, cached_time) in cache.items()
+                if not 0 <= current_time_sec - cached_time <= CACHE_TTL_SEC
+            ]
+            for key in expired:
+                del cache[key]
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Match cache size and hit/miss counters"""
+        return {"size": len(self.cache), "hits": self._hits, "misses": self._misses}
@@ -2,9 +2,11 @@
 Shapefile Loader for Station and Rail Section Data
 Loads geographic data from Japanese national land information shapefiles
 """
+import struct
+import numpy as np
 import shapefile
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Tuple
 
 
 class ShapefileLoader:
@@ -12,7 +14,7 @@ class ShapefileLoader:
         self.station_shp = Path(station_shp_path)
         self.rail_shp = Path(rail_shp_path) if rail_shp_path else None
         self.stations: Dict[str, dict] = {}
-        self.rail_paths: Dict[str, List[List[dict]]] = {}
+        self.rail_paths: Dict[str, List[np.ndarray]] = {}  # railway -> (N, 2) float32 [lat, lng] polylines
 
     def load_stations(self) -> Dict[str, dict]:
         """Load station data from shapefile"""
@@ -24,24 +26,19 @@ class ShapefileLoader:
         try:
             sf = shapefile.Reader(str(self.station_shp), encoding='shift-jis')
 
-            for record in sf.iterShapeRecords():
-                try:
-                    # Get attributes (field names may vary)
-                    rec = record.record
-                    fields = [field[0] for field in sf.fields[1:]]  # Skip DeletionFlag
+            # Resolve attribute columns once (field names may vary) and decode only those
+            name_field = _field_name(sf, 'N02_005')
+            railway_field = _field_name(sf, 'N02_003')
+            operator_field = _field_name(sf, 'N02_004')
+            wanted = [f for f in (name_field, railway_field, operator_field) if f]
 
+            for record in sf.iterShapeRecords(fields=wanted):
+                try:
                     # Try to get station name and railway info
-                    station_name = None
-                    railway_name = None
-                    operator = None
-
-                    for i, field in enumerate(fields):
-                        if 'N02_005' in field:
-                            station_name = rec[i] if i < len(rec) else None
-                        elif 'N02_003' in field:
-                            railway_name = rec[i] if i < len(rec) else None
-                        elif 'N02_004' in field:
-                            operator = rec[i] if i < len(rec) else None
+                    rec = record.record
+                    station_name = _field_value(rec, name_field)
+                    railway_name = _field_value(rec, railway_field)
+                    operator = _field_value(rec, operator_field)
 
                     # Get coordinates
                     if record.shape.points:
@@ -64,8 +61,8 @@ class ShapefileLoader:
 
         return self.stations
 
-    def load_rail_sections(self) -> Dict[str, List[List[dict]]]:
-        """Load rail section data from shapefile"""
+    def load_rail_sections(self) -> Dict[str, List[np.ndarray]]:
+        """Load rail section data from shapefile (serialize with orjson.OPT_SERIALIZE_NUMPY)"""
         if not self.rail_shp or not self.rail_shp.exists():
             print("[Shapefile] Rail section file not provided or not found")
             return {}
@@ -74,25 +71,38 @@ class ShapefileLoader:
         try:
             sf = shapefile.Reader(str(self.rail_shp), encoding='shift-jis')
 
-            for record in sf.iterShapeRecords():
+            # Resolve the railway column once and decode only that field
+            railway_field = _field_name(sf, 'N02_003')
+            wanted = [railway_field] if railway_field else []
+
+            # Geometry is read straight from the .shp bytes; pyshp only decodes attributes
+            try:
+                polylines = _read_shp_points(self.rail_shp)
+            except (struct.error, ValueError) as e:
+                print(f"[Shapefile] Warning: could not parse {self.rail_shp.name} directly: {e}")
+                polylines = None
+
+            if polylines is not None and len(polylines) == len(sf):
+                rows = zip(sf.iterRecords(fields=wanted), polylines)
+            else:
+                # Shapes and attribute records don't line up 1:1; let pyshp pair them
+                if polylines is not None:
+                    print(f"[Shapefile] Warning: {len(polylines)} shapes for {len(sf)} records, "
+                          f"reading geometry through pyshp")
+                rows = (
+                    (shape_rec.record, np.asarray(shape_rec.shape.points, dtype=np.float64).reshape(-1, 2))
+                    for shape_rec in sf.iterShapeRecords(fields=wanted)
+                )
+
+            for rec, points in rows:
                 try:
                     # Get railway information
-                    rec = record.record
-                    fields = [field[0] for field in sf.fields[1:]]
-
-                    railway_name = None
-                    line_name = None
-
-                    for i, field in enumerate(fields):
-                        if 'N02_003' in field:
-                            railway_name = rec[i] if i < len(rec) else None
-                        elif 'N02_002' in field:
-                            line_name = rec[i] if i < len(rec) else None
+                    railway_name = _field_value(rec, railway_field)
 
                     # Get line coordinates
-                    if record.shape.points and railway_name:
-                        points = record.shape.points
-                        coordinates = [{"lat": p[1], "lng": p[0]} for p in points]
+                    if len(points) and railway_name:
+                        # Shapefile points are (lng, lat); store as contiguous [lat, lng] rows
+                        coordinates = np.ascontiguousarray(points[:, ::-1], dtype=np.float32)
 
                         key = railway_name
                         if key not in self.rail_paths:
@@ -115,18 +125,101 @@ class ShapefileLoader:
         enhanced = 0
 
         try:
+            sf_names = list(self.stations)
+            name_rank, substring_rank = self._build_name_index(sf_names)
+
             for odpt_id, odpt_station in station_mapper.odpt_stations.items():
                 odpt_name = odpt_station.get("name", "")
+                if not odpt_name:
+                    continue
 
-                # Search for matching station in shapefile
-                for sf_name, sf_station in self.stations.items():
-                    if odpt_name and (odpt_name in sf_name or sf_name in odpt_name):
-                        # Update with more accurate coordinates
-                        odpt_station["lat"] = sf_station["lat"]
-                        odpt_station["lon"] = sf_station["lng"]
-                        enhanced += 1
-                        break
+                # First shapefile station (in load order) whose name contains
+                # odpt_name or is contained in it
+                best = substring_rank.get(odpt_name)
+                for sub in _substrings(odpt_name):
+                    rank = name_rank.get(sub)
+                    if rank is not None and (best is None or rank < best):
+                        best = rank
+
+                if best is not None:
+                    # Update with more accurate coordinates
+                    sf_station = self.stations[sf_names[best]]
+                    odpt_station["lat"] = sf_station["lat"]
+                    odpt_station["lon"] = sf_station["lng"]
+                    enhanced += 1
 
             print(f"[Shapefile] Enhanced {enhanced} station coordinates")
         except Exception as e:
             print(f"[Shapefile] Error enhancing mapping: {e}")
+
+    @staticmethod
+    def _build_name_index(sf_names: List[str]) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """
+        Index shapefile station names for substring matching
+
+        Returns:
+            (name -> load order rank, substring -> lowest rank of a name containing it)
+        """
+        name_rank = {name: rank for rank, name in enumerate(sf_names)}
+        substring_rank: Dict[str, int] = {}
+        for rank, name in enumerate(sf_names):
+            for sub in _substrings(name):
+                substring_rank.setdefault(sub, rank)
+        return name_rank, substring_rank
+
+
+def _substrings(text: str) -> Set[str]:
+    """All non-empty substrings of text (station names are short)"""
+    return {text[i:j] for i in range(len(text)) for j in range(i + 1, len(text) + 1)}
+
+
+# Shape types laid out as bbox, numParts, numPoints, parts, points (PolyLine/Polygon, plain/Z/M)
+_MULTIPART_TYPES = {3, 5, 13, 15, 23, 25}
+
+
+def _read_shp_points(shp_path: Path) -> List[np.ndarray]:
+    """
+    Read every record's points from a .shp file without per-point Python objects
+
+    Returns:
+        One (N, 2) float64 [x, y] array per record in file order (all parts
+        concatenated, like pyshp's shape.points); empty for null or other shapes
+    """
+    data = shp_path.read_bytes()
+    empty = np.empty((0, 2), dtype=np.float64)
+    records = []
+
+    offset = 100  # Fixed-size file header
+    while offset + 8 <= len(data):
+        # Record header: number and content length (16-bit words), big-endian
+        _, length = struct.unpack_from('>2i', data, offset)
+        content = offset + 8
+        offset = content + 2 * length
+
+        shape_type = struct.unpack_from('<i', data, content)[0]
+        if shape_type not in _MULTIPART_TYPES:
+            records.append(empty)
+            continue
+
+        # Skip the bounding box (4 doubles), then the part offsets
+        num_parts, num_points = struct.unpack_from('<2i', data, content + 36)
+        points_at = content + 44 + 4 * num_parts
+        records.append(
+            np.frombuffer(data, dtype='<f8', count=2 * num_points, offset=points_at).reshape(-1, 2)
+        )
+
+    return records
+
+
+def _field_name(sf: shapefile.Reader, code: str) -> Optional[str]:
+    """Name of the last attribute field containing code (None if absent)"""
+    name = None
+    for field in sf.fields[1:]:  # Skip DeletionFlag
+        if code in field[0]:
+            name = field[0]
+    return name
+
+
+def _field_value(rec, field: Optional[str]):
+    """Record value for a field resolved by _field_name (None if absent)"""
+    return rec[field] if field else None
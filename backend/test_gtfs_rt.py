@@ -48,6 +48,12 @@ async def main():
     interpolator = GTFSInterpolator(gtfs_loader)
     print()
 
+    # Position every vehicle once, in one batched call; steps 5 and 6 both read these
+    positions = interpolator.calculate_positions_batch(
+        trip_ids=[vehicle['trip_id'] for vehicle in vehicles],
+        timestamps=[vehicle['timestamp'] for vehicle in vehicles]
+    )
+
     # 5. Test interpolation for first 10 vehicles
     print("[5] Testing interpolation for sample vehicles...")
     print("-" * 80)
@@ -56,19 +62,12 @@ async def main():
     fail_count = 0
 
     # Show detailed info for first 10 vehicles
-    for i, vehicle in enumerate(vehicles[:10]):
+    for i, (vehicle, position) in enumerate(zip(vehicles[:10], positions)):
         print(f"\nVehicle #{i+1}:")
         print(f"  entity_id: {vehicle['entity_id']}")
         print(f"  trip_id: {vehicle['trip_id']}")
         print(f"  timestamp: {vehicle['timestamp']}")
 
-        # Calculate position
-        position = interpolator.calculate_position(
-            trip_id=vehicle['trip_id'],
-            timestamp=vehicle['timestamp'],
-            entity_id=vehicle['entity_id']
-        )
-
         if position:
             print(f"  ✓ Position calculated:")
             print(f"    lat: {position['lat']:.6f}")
@@ -94,13 +93,7 @@ async def main():
     interpolated_count = 0
     fallback_count = 0
 
-    for vehicle in vehicles:
-        position = interpolator.calculate_position(
-            trip_id=vehicle['trip_id'],
-            timestamp=vehicle['timestamp'],
-            entity_id=vehicle['entity_id']
-        )
-
+    for position in positions:
         if position:
             total_success += 1
             if position['interpolated']:
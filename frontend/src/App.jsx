@@ -35,21 +35,30 @@ function App() {
   useEffect(() => {
     const es = new EventSource('http://localhost:8000/api/trains/stream');
 
+    // Rail paths (sent once per connection)
+    es.addEventListener('rail_paths', (e) => {
+      setRailPaths(JSON.parse(e.data));
+      console.log('[Rail] Loaded rail paths');
+    });
+
     es.addEventListener('snapshot', (e) => {
       const data = JSON.parse(e.data);
 
-      // Rail paths (first time only)
-      if (data.rail_paths && Object.keys(railPaths).length === 0) {
-        setRailPaths(data.rail_paths);
-        console.log('[Rail] Loaded rail paths');
-      }
+      // Vehicles arrive as columns (one array per field); rebuild one object per train
+      const columns = data.vehicles || {};
+      const fields = Object.keys(columns);
+      const vehicles = Array.from({ length: data.count || 0 }, (_, i) => {
+        const train = {};
+        fields.forEach(field => { train[field] = columns[field][i]; });
+        return train;
+      });
 
-      setTrains(data.vehicles || []);
+      setTrains(vehicles);
 
       // Calculate stats
-      const total = data.vehicles?.length || 0;
-      const matched = data.vehicles?.filter(t => t.interpolated).length || 0;
-      const delayed = data.vehicles?.filter(t => t.delay > 60).length || 0;
+      const total = vehicles.length;
+      const matched = vehicles.filter(t => t.interpolated).length;
+      const delayed = vehicles.filter(t => t.delay > 60).length;
       setStats({ total, matched, delayed });
     });
 
@@ -118,9 +127,9 @@ function App() {
         paths.forEach(path => {
           if (path.length < 2) return;
           ctx.beginPath();
-          path.forEach((point, i) => {
-            const x = lngToX(point.lng);
-            const y = latToY(point.lat);
+          path.forEach(([lat, lng], i) => {
+            const x = lngToX(lng);
+            const y = latToY(lat);
             if (i === 0) ctx.moveTo(x, y);
             else ctx.lineTo(x, y);
           });
@@ -1,7 +1,27 @@
+"""
+GTFS-RT vehicle feed dump
+
+Parses with protobuf's native runtime (upb, bundled with protobuf >= 4),
+which is far faster than the pure-Python implementation. The environment
+variable must be set before the first protobuf import to take effect.
+"""
+import os
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "upb")
+
 from google.transit import gtfs_realtime_pb2
 import gzip
 
+# Reused across parses: Clear() + ParseFromString() instead of reallocating
 feed = gtfs_realtime_pb2.FeedMessage()
+
+
+def parse_feed(data: bytes) -> gtfs_realtime_pb2.FeedMessage:
+    """Parse a serialized FeedMessage into the shared instance"""
+    feed.Clear()
+    feed.ParseFromString(data)
+    return feed
+
+
 with open(r"C:\Users\bunta\NowTrain-v2\train_json\jreast_odpt_train_vehicle (5)", "rb") as f:
     data = f.read()
 
@@ -9,9 +29,12 @@ with open(r"C:\Users\bunta\NowTrain-v2\train_json\jreast_odpt_train_vehicle (5)"
 # gzip 圧縮されてる場合はここで解凍
 # data = gzip.decompress(data)
 
-feed.ParseFromString(data)
+parse_feed(data)
 
-for entity in feed.entity[:5]:
+# Only the first 5 entities are printed; stop iterating there
+for i, entity in enumerate(feed.entity):
+    if i == 5:
+        break
     if entity.HasField("vehicle"):
         v = entity.vehicle
         print("entity_id:", entity.id)